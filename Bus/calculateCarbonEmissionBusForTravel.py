@@ -1,19 +1,51 @@
-import json
-import boto3
+import async_aws
+import electricity_factors
+import emission_calculator
+import emission_store
+import factor_repository
+import fan_out
+import function_invoker
+import instrumentation
+import result_cache
+import route_cache
+import vector_math
 
 # -------------------------------------------------------------------------------
 # Author: NMunoz, YHu
 # This function receives the distance, fuel type (diesel or electricity)  
 # and an JSON-Object with the fields Origin, Destination
-# It returns co2, NOx and PM emission as a float
+# It returns co2, NOx and PM emission as a float: a diesel bus in kg per
+# passenger, an electric bus (electricity mix of the departure country) in t
+# for the whole bus
 # All the route calculation logic is done by Google Directions API
 # Example for test: "Origin": "Frankfurt","Destination": "Berlin", "Fuel": "1" -> CO2_fin, NOx_fin, PM_fin
+# The emission values (factor_repository), the calculation and the calls of
+# other functions are part of the shared layer. Routes which were calculated
+# before come from the route_cache, the electricity mix of a country comes from
+# the electricity_factors cache.
+#
+# Batch mode: instead of a single trip a list of trips can be sent
+# Example for test: {"trips": [{"Origin": "Frankfurt", "Destination": "Berlin", "fuel": "1"},
+#                              {"Origin": "Hamburg", "Destination": "Berlin", "fuel": "-1"}]}
+# -> one result per trip. Every route is requested once, the electricity mix
+# once per departure country and the diesel emissions in one array operation.
+# Repeated requests are answered from the result_cache.
+# Successful trips are recorded in the emission_store (EMISSION_STORE_PREFIX).
+# lambda_handler_async is the same handler for the asyncio execution mode.
 # -------------------------------------------------------------------------------
 
-client = boto3.client('lambda')
+# fuel of the event -> fuel of the reply
+fuel_names = {"1": "diesel", "-1": "electricity"}
 
+@instrumentation.traced_handler("bus")
+@emission_store.recorded_handler("bus")
+@result_cache.cached_handler("bus")
 def lambda_handler(event, context):
-    
+
+  #Batch mode, if a list of trips is given
+  if "trips" in event:
+      return calculate_trips(event["trips"], context)
+
   try:
       
     #Check if Origin is given
@@ -40,17 +72,9 @@ def lambda_handler(event, context):
     # invoke-parameters for the function getSpeedValuesBetweenTwoWaypoints
     origin = event["Origin"]
     destination = event["Destination"]
-    inputForInvoker = {'Origin': origin, 'Destination': destination}
-    
+
     # call getSpeedValuesBetweenTwoWaypoints-Function
-    response = client.invoke(
-        FunctionName='arn:aws:lambda:eu-central-1:663325156950:function:getSpeedValuesBetweenTwoWaypoints',
-        InvocationType='RequestResponse',
-        Payload=json.dumps(inputForInvoker),
-    )
-    
-    # receive the Payload file and transfer it to Json format
-    responseJson = json.load(response['Payload'])
+    responseJson = get_route(origin, destination)
     input_json = responseJson['input']
     body_json = responseJson['body']
     statusCode = responseJson['statusCode']
@@ -70,16 +94,7 @@ def lambda_handler(event, context):
     # If fuel = 1 -> calculation for a diesel bus
     if(fuel == "1"):
         try:
-            # All the value in grams per person-kilometer
-            busCo2Emission = 33
-            busNOxEmission = 0.21
-            busPMEmission = 0.0044
-            
-            # Calculete the total emission and transfer gram to ton
-            Co2EmissionFinal =  busCo2Emission*distance/1000000
-            NOxEmissionFinal = busNOxEmission*distance/1000000
-            PMEmissionFinal = busPMEmission*distance/1000000
-            
+            # Calculete the emission of one passenger in kg
             # response if everything was correctly calcuated
             return{
                 'statusCode':200,
@@ -88,11 +103,7 @@ def lambda_handler(event, context):
                     'Destination': destination,
                     'Fuel': "diesel"
                 },
-                'body':{
-                    'Co2EmissionFinal': Co2EmissionFinal,
-                    'NOxEmissionFinal': NOxEmissionFinal,
-                    'PMEmissionFinal': PMEmissionFinal
-                }
+                'body': emission_calculator.get_diesel_bus_emissions(distance, factor_repository.get_factor("BusEmissionFactors", "diesel"))
             }
 
         except Exception:
@@ -104,21 +115,10 @@ def lambda_handler(event, context):
     # If fuel = -1 -> calculation for an electric bus
     if(fuel == "-1"):
         try:
-            # All values in kwh/km
-            busConsumption = 1.296
-            totalConsumption = busConsumption*distance
+            totalConsumption = emission_calculator.get_electric_bus_consumption(distance, factor_repository.get_factor("BusEmissionFactors", "electricity"))
             
-            inputForInvoker2 = {'country': departure_country, 'kWh': totalConsumption, "green_electricity": 0}
-    
-            # call calculateEmissionsForElectricityByCountry -Function
-            response2 = client.invoke(
-                FunctionName='arn:aws:lambda:eu-central-1:663325156950:function:calculateEmissionsForElectricityByCountry',
-                InvocationType='RequestResponse',
-                Payload=json.dumps(inputForInvoker2),
-            )
-            
-            # receive the Payload file and transfer it to Json format
-            responseJson2 = json.load(response2['Payload'])
+            # emissions of calculateEmissionsForElectricityByCountry, scaled from the cached mix of the country
+            responseJson2 = electricity_factors.get_emissions(departure_country, totalConsumption)
             body_json2 = responseJson2['body']
             statusCode2 = responseJson2['statusCode']
 
@@ -180,4 +180,155 @@ def lambda_handler(event, context):
            'errorMsg': "Unkown Error!"
        }
 
-  
+
+#asyncio execution mode (see async_aws), e.g. for bulk jobs with many batches
+@instrumentation.traced_handler("bus")
+@emission_store.recorded_handler("bus")
+@result_cache.cached_handler("bus")
+async def lambda_handler_async(event, context):
+    if "trips" in event:
+        return await calculate_trips_async(event["trips"], context)
+    # The lookups of a single trip depend on each other, it runs on the thread pool
+    return await async_aws.run(lambda_handler, event, context)
+
+
+#Returns the reply of getSpeedValuesBetweenTwoWaypoints for a route
+def get_route(origin, destination):
+    inputForInvoker = {'Origin': origin, 'Destination': destination}
+    return route_cache.get_route(origin, destination, "driving",
+        lambda: function_invoker.invoke('getSpeedValuesBetweenTwoWaypoints', inputForInvoker))
+
+
+#Batch mode: calculates the emissions of many trips. All routes and all
+#electricity mixes are requested at the same time, each of them only once.
+def calculate_trips(trips, context):
+    if not isinstance(trips, list):
+        return {
+            'statusCode': 400,
+            'body': "trips has to be a list!"
+        }
+    results, lookups = get_route_lookups(trips)
+    route_replies, route_errors = fan_out.fan_out(lookups, fan_out.get_timeout(context))
+    distances, electric_trips = calculate_diesel_trips(trips, results, route_replies, route_errors)
+    lookups = {country: (electricity_factors.get_mix, country) for country in electric_trips}
+    mixes, mix_errors = fan_out.fan_out(lookups, fan_out.get_timeout(context))
+    calculate_electric_trips(trips, results, distances, electric_trips, mixes, mix_errors)
+    return {
+        'statusCode': 200,
+        'trips': results
+    }
+
+
+#Same as calculate_trips, the lookups run on the event loop (see async_aws)
+async def calculate_trips_async(trips, context):
+    if not isinstance(trips, list):
+        return {
+            'statusCode': 400,
+            'body': "trips has to be a list!"
+        }
+    results, lookups = get_route_lookups(trips)
+    route_replies, route_errors = await async_aws.gather(lookups, fan_out.get_timeout(context))
+    distances, electric_trips = calculate_diesel_trips(trips, results, route_replies, route_errors)
+    lookups = {country: (electricity_factors.get_mix, country) for country in electric_trips}
+    mixes, mix_errors = await async_aws.gather(lookups, fan_out.get_timeout(context))
+    calculate_electric_trips(trips, results, distances, electric_trips, mixes, mix_errors)
+    return {
+        'statusCode': 200,
+        'trips': results
+    }
+
+
+#Checks the trips, returns the error replies of the trips (None for valid
+#trips) and the lookups of the routes
+def get_route_lookups(trips):
+    results = [None] * len(trips)
+    for index, trip in enumerate(trips):
+        if not isinstance(trip, dict):
+            results[index] = {'statusCode': 400, 'body': "trip has to be an object!"}
+            continue
+        missing = [field for field in ("Origin", "Destination", "fuel") if field not in trip]
+        if missing:
+            results[index] = {'statusCode': 400, 'body': ", ".join(missing) + " is not defined!"}
+        elif not isinstance(trip["Origin"], str) or not isinstance(trip["Destination"], str):
+            results[index] = {'statusCode': 400, 'body': "Origin and Destination have to be a text!"}
+        elif not isinstance(trip["fuel"], str) or trip["fuel"] not in fuel_names:
+            results[index] = {
+                'statusCode': 400,
+                'errorMsg': "Given fuelType is not valid!\nPlease enter 1 for diesel or -1 for electricity"
+            }
+
+    # call getSpeedValuesBetweenTwoWaypoints once for every route
+    routes = {(trip["Origin"], trip["Destination"]) for trip, result in zip(trips, results) if result is None}
+    return results, {route: (get_route,) + route for route in routes}
+
+
+#Calculates the diesel trips, returns the distances of all trips and the
+#electric trips grouped by their departure country. A trip whose route lookup
+#failed (e.g. a timeout) gets the error of the lookup.
+def calculate_diesel_trips(trips, results, route_replies, route_errors):
+    distances = {} # index of the trip -> distance in m
+    diesel_trips = []
+    electric_trips = {} # departure country -> indices of the trips
+    for index, trip in enumerate(trips):
+        if results[index] is not None:
+            continue
+        route = (trip["Origin"], trip["Destination"])
+        if route in route_errors:
+            results[index] = {'statusCode': 400, 'errorMsg': route_errors[route]}
+            continue
+        responseJson = route_replies.get(route)
+        try:
+            if responseJson['statusCode'] != 200:
+                raise KeyError('statusCode')
+            distances[index] = responseJson['body']["distance"]
+            if trip["fuel"] == "-1":
+                electric_trips.setdefault(responseJson['input']["departure_country"], []).append(index)
+            else:
+                diesel_trips.append(index)
+        except (KeyError, TypeError):
+            results[index] = {
+                'statusCode': 400,
+                'errorMsg': "FunctionCall of getSpeedValuesBetweenTwoWaypoints did not work!"
+            }
+
+    # Diesel buses: the emissions of all trips in one array operation
+    if diesel_trips:
+        emissions = emission_calculator.get_diesel_bus_emissions_batch(
+            [distances[index] for index in diesel_trips], factor_repository.get_factor("BusEmissionFactors", "diesel"))
+        for index, body in zip(diesel_trips, emissions):
+            results[index] = trip_reply(trips[index], body)
+    return distances, electric_trips
+
+
+#Electric buses: the mix of every departure country (electricity_factors) is
+#scaled to the consumption of the trips
+def calculate_electric_trips(trips, results, distances, electric_trips, mixes, mix_errors):
+    if not electric_trips:
+        return
+    electricity = factor_repository.get_factor("BusEmissionFactors", "electricity")
+    for country, indices in electric_trips.items():
+        responseJson = mixes.get(country)
+        if responseJson is None or responseJson.get('statusCode') != 200:
+            for index in indices:
+                results[index] = {
+                    "statusCode": 400,
+                    "errorMsg": mix_errors.get(country, "Error occurred while calling the the LambdaFunction-calculateEmissionsForElectricityByCountry")
+                }
+            continue
+        consumptions = [emission_calculator.get_electric_bus_consumption(distances[index], electricity) for index in indices]
+        emissions = vector_math.outer(consumptions, [responseJson['body'][name] for name in electricity_factors.electricity_values])
+        for index, values in zip(indices, emissions):
+            results[index] = trip_reply(trips[index], dict(zip(electricity_factors.electricity_values, values)))
+
+
+#Reply for one trip of the batch mode, the same as for a single trip
+def trip_reply(trip, body):
+    return {
+        'statusCode': 200,
+        'input': {
+            'Origin': trip["Origin"],
+            'Destination': trip["Destination"],
+            'Fuel': fuel_names[trip["fuel"]]
+        },
+        'body': body
+    }
@@ -1,7 +1,15 @@
 import json
-import boto3
-import requests
-import database_helper
+import async_aws
+import factor_repository
+import electricity_factors
+import emission_store
+import fan_out
+import fuel_models
+import function_invoker
+import instrumentation
+import result_cache
+import route_cache
+import segment_engine
 
 # -------------------------------------------------------------------------------
 # Author: JBoba, NMunoz, YHu
@@ -10,42 +18,96 @@ import database_helper
 # It returns co2 emission as a float
 # All the route calculation logic is done by Google Directions API
 # Example for test: 'Origin'= 'Frankfurt','Destination'='Berlin','Region'='DE','Vehicle_type'='SmallDieselCar' -> CO2_fin
+# Other functions are called through function_invoker (shared layer), which runs
+# them in-process if possible and invokes the Lambda function otherwise.
+# All lookups which only depend on the request are done at the same time (fan_out),
+# the emission factors of the fuel are read together from the factor_repository.
+# Routes which were calculated before come from the route_cache.
+# The calculation of every fuel is described by the fuel_models registry, the
+# electricity mix of electric cars comes from the electricity_factors cache.
+# If the route has a speed profile, the fuel is calculated per segment of the
+# route (segment_engine) instead of per city and highway distance.
+# Repeated requests are answered from the result_cache.
+# Successful trips are recorded in the emission_store (EMISSION_STORE_PREFIX).
+# lambda_handler_async is the same handler for the asyncio execution mode.
 # -------------------------------------------------------------------------------
 
-dynamodb = boto3.resource('dynamodb')
-client = boto3.client('lambda')
-
 
+@instrumentation.traced_handler("car")
+@emission_store.recorded_handler("car")
+@result_cache.cached_handler("car")
 def lambda_handler(event, context):
-    
+    reply, lookups = get_lookups(event)
+    if reply is not None:
+        return reply
+    results, errors = fan_out.fan_out(lookups, fan_out.get_timeout(context))
+    return calculate(event, results, errors)
+
+
+#asyncio execution mode (see async_aws), the lookups run on the event loop
+@instrumentation.traced_handler("car")
+@emission_store.recorded_handler("car")
+@result_cache.cached_handler("car")
+async def lambda_handler_async(event, context):
+    reply, lookups = get_lookups(event)
+    if reply is not None:
+        return reply
+    results, errors = await async_aws.gather(lookups, fan_out.get_timeout(context))
+    return await async_aws.run(calculate, event, results, errors)
+
+
+#Checks the event, returns an error reply or the lookups of the request
+def get_lookups(event):
     #Check if Origin is given
     if "Origin" not in event:
         return {
             'statusCode': 400,
             'body': "Origin is not defined!" 
-        }
+        }, None
         
     #Check if Destination is given
     if "Destination" not in event:
         return {
             'statusCode': 400,
             'body': "Destination is not defined!" 
-        }
+        }, None
     
     # invoke-parameters for the function getSpeedValuesBetweenTwoWaypoints
     origin = event["Origin"]
     destination = event["Destination"]
     inputForInvoker = {'Origin': origin, 'Destination': destination}
 
-    # call getSpeedValuesBetweenTwoWaypoints-Function
-    response = client.invoke(
-        FunctionName='arn:aws:lambda:eu-central-1:663325156950:function:getSpeedValuesBetweenTwoWaypoints',
-        InvocationType='RequestResponse',
-        Payload=json.dumps(inputForInvoker),
-    )
+    fuelconsumption = event["fuel consumption"]
+    fuel = event["fuel"]
+
+    # The route, the emission factors of the fuel and the average consumption
+    # do not depend on each other, therefore they are requested at the same time
+    lookups = {
+        # call getSpeedValuesBetweenTwoWaypoints-Function
+        'route': (route_cache.get_route, origin, destination, "driving",
+                  lambda: function_invoker.invoke('getSpeedValuesBetweenTwoWaypoints', inputForInvoker)),
+        # Tables EmissionsFactorsAfterDIN16258 (scope1) and EmissionFactorsFuel_WTT (scope3)
+        'factors': (factor_repository.get_factors, [("EmissionFactorsAfterDIN16258", fuel), ("EmissionFactorsFuel_WTT", fuel)])
+    }
+    if (fuelconsumption == "-1"):
+        inputForConsumption = {'fuel': fuel, 'VClass': event["VClass"], 'productionYear': event["productionYear"]}
+        lookups['consumption'] = (function_invoker.invoke, 'getCarFuelConsumptionAverage', inputForConsumption)
+    return None, lookups
 
-    # receive the Payload file and transfer it to Json format
-    responseJson = json.load(response['Payload'])
+
+#Calculates the emissions from the results of the lookups
+def calculate(event, results, errors):
+    fuelconsumption = event["fuel consumption"]
+    fuel = event["fuel"]
+
+    if errors:
+        return {
+            'statusCode': 400,
+            'body': "Some lookups did not work!",
+            'errors': errors
+        }
+
+    responseJson = results['route']
     body_json = responseJson['body']
     statusCode = responseJson['statusCode']
 
@@ -62,113 +124,53 @@ def lambda_handler(event, context):
             'body': "Some kind of Error in GoogleDirectionsAPI occured: " + str(statusCode)
         }
 
-    fuelconsumption = event["fuel consumption"]
-    fuel = event["fuel"]
-    
-    table = dynamodb.Table("EmissionFactorsAfterDIN16258")
-    response = table.get_item(
-        Key={
-            'fuel_type': fuel  # returns the item of the chosen fuel type in Table EmissionsFactorsAfterDIN16258
+    item = results['factors'][("EmissionFactorsAfterDIN16258", fuel)]
+    itemWTT = results['factors'][("EmissionFactorsFuel_WTT", fuel)]
+    if item is None or itemWTT is None:
+        return {
+            'statusCode': 400,
+            'body': {
+                'error': "fuel type not found in Database",
+                'wrongFuelType': fuel
+            }
         }
-    )
-    item = response['Item']
-    tank_to_wheel = float(item["THG_emissionfactor_TTW_kgCo2e/l"]) / 1000  # convert to ton
+    # The fuel model and its coefficients (in tons per unit of fuel) are
+    # resolved once per container, see fuel_models
+    model = fuel_models.resolve_model(fuel)
+    scope1_coefficients, wtt_coefficient = fuel_models.get_coefficients(model, item, itemWTT)
+    segments = segment_engine.get_segments(body_json)
 
     if (fuelconsumption == "-1"):
-        VClass=event["VClass"]
-        productionYear=event["productionYear"]
-
-        inputForInvoker = {'fuel': fuel, 'VClass': VClass, 'productionYear': productionYear}
-        response = client.invoke(
-            FunctionName='arn:aws:lambda:eu-central-1:663325156950:function:getCarFuelConsumptionAverage',
-            InvocationType='RequestResponse',
-            Payload=json.dumps(inputForInvoker),
-        )
-        responseJson = json.load(response['Payload'])
-        body_json = responseJson['body']
-        if (fuel == "Electricity"):
-            fuelInLPer100KmCity = body_json["electricityInKWHPer100KmCity"]
-            fuelInLPer100KmHighway = body_json["electricityInKWHPer100KmHighway"]
-            fuelInLPer100KmComb = body_json["electricityInKWHPer100KmComb"]
-            fuelconsumption = fuelInLPer100KmComb /100
-        else :
-            fuelInLPer100KmCity = body_json["fuelInLPer100KmCity"]
-            fuelInLPer100KmHighway = body_json["fuelInLPer100KmHighway"]
-            fuelInLPer100KmComb = body_json["fuelInLPer100KmComb"]
-            fuelconsumption = fuelInLPer100KmComb /100
-
-        fuelInLPerKmCity = fuelInLPer100KmCity / 100  # convert from l/100km to l/km
-        fuelInLPerKmHighway = fuelInLPer100KmHighway / 100  # convert from l/100km to l/km
-        CO2_äquivalent_city = float(distanceKmCity) * fuelInLPerKmCity * tank_to_wheel  # multiplies distance, fuelconsumption(l/km), co2equivalent of fueltype
-        CO2_äquivalent_highway = float(distanceKmHighway) * fuelInLPerKmHighway * tank_to_wheel  # multiplies distance, fuelconsumption(l/km), co2equivalent of fueltype
-        CO2_äquivalent = CO2_äquivalent_city + CO2_äquivalent_highway
-        if (fuel == "Diesel"):
-            CO2_fin_city = float(distanceKmCity) * fuelInLPerKmCity * 2.64/1000  # multiplies distance, fuelconsumption(l/km), co2 of fueltype(in t)
-            CO2_fin_highway = float(distanceKmHighway) * fuelInLPerKmHighway * 2.64/1000  # multiplies distance, fuelconsumption(l/km), co2 of fueltype (in t)
-            CO2_fin = CO2_fin_city + CO2_fin_highway
-            
-        if (fuel == "Petrol"):
-            CO2_fin_city = float(distanceKmCity) * fuelInLPerKmCity * 2.33/1000  # multiplies distance, fuelconsumption(l/km), co2 of fueltype(in t)
-            CO2_fin_highway = float(distanceKmHighway) * fuelInLPerKmHighway * 2.33/1000  # multiplies distance, fuelconsumption(l/km), co2 of fueltype(in t)
-            CO2_fin = CO2_fin_city + CO2_äquivalent_highway
+        # consumption in l/100km (kwh/100km for electricity) for city and highway
+        body_json = results['consumption']['body']
+        consumption = model['consumption']
+        fuelconsumption = body_json[consumption + "Comb"] / 100  # convert from l/100km to l/km
+        scope1_amount = float(distanceKmCity) * body_json[consumption + "City"] / 100 \
+            + float(distanceKmHighway) * body_json[consumption + "Highway"] / 100
     else:
         fuelconsumption = float(fuelconsumption) / 100  # convert from l/100km to l/km
-        CO2_äquivalent = float(distance / 1000) * fuelconsumption * tank_to_wheel  # multiplies distance, fuelconsumption(l/km), co2equivalent of fueltype
-        if (fuel == "Diesel"):
-            CO2_fin = float(distance / 1000) * fuelconsumption * 2.64  # multiplies distance, fuelconsumption(l/km), co2equivalent of fueltype
-        if (fuel == "Petrol"):
-            CO2_fin = float(distance / 1000) * fuelconsumption * 2.33  # multiplies distance, fuelconsumption(l/km), co2equivalent of fueltype
-
-    #Access to the Database helper function for the specific fuel type
-    emission_data = json.loads(database_helper.search_in_database(fuel))
-    
-    #scope3 ----------------------------------------------------------------
-    tableWTT = dynamodb.Table("EmissionFactorsFuel_WTT")
-    responseWTT = tableWTT.get_item(
-        Key={
-            'fuel_type': fuel  # returns the item of the chosen fuel type in Table EmissionsFactorsAfterDIN16258
-        }
-    )
-    itemWTT = responseWTT['Item']
-    
-    if(fuel == 'Diesel' or fuel == 'Petrol' or fuel == 'Biodiesel' or fuel == 'Ethanol'):
-     wtt_Co2 = float(itemWTT["THG_emissionfactor_WTT_kgCo2e/l"]) / 1000  # in kgCo2e/l -> /1000 to get TCo2e 
-     wtt_result = wtt_Co2  * float(fuelconsumption) * float(distance / 1000)
-     
-    if(fuel == 'LPG' or fuel == 'CNG' or fuel == 'LNG'):
-     wtt_Co2 = float(itemWTT["THG_emissionfactor_WTT_kgCo2e/kg"])   # in kgCo2e/kg -> /1000 to get TCo2e
-     wtt_result = wttCo2 * float(fuelconsumption) * float(distance / 1000)
-     
-    if(fuel == 'Electricity'): #still to do
-     wtt_result = "no Well to Tank Emissions!"
-    #-------------------------------------------------------
-    
-    #Stores the Co2ePerLiter
-    Co2ePerLiter = float(emission_data['fuel_values'][0]['THG_emissionfactor_TTW_kgCo2e/l'])
-    if (fuel == "Diesel" or fueltype == "Petrol"):
-        # call getAllGreenHouseGasOfCO2-Function
-        inputForInvoker = {'CO2': CO2_fin, 'fuel': fuel}
-        response = client.invoke(
-            FunctionName='arn:aws:lambda:eu-central-1:663325156950:function:getAllGreenHouseGasOfCO2',
-            InvocationType='RequestResponse',
-            Payload=json.dumps(inputForInvoker),
-        )
-        
-        # receive the Payload file and transfer it to Json format
-        responseJson = json.load(response['Payload'])
-        body_json = responseJson['body']
-        # Scope1-TankToWheel-Diesel
-        CO = body_json["CO"]
-        NOx = body_json["NOx"]
-        HC = body_json["HC"]
+        scope1_amount = float(distance / 1000) * fuelconsumption
+    # amount of fuel used on the whole distance
+    scope3_amount = float(distance / 1000) * fuelconsumption
+    # With a speed profile the fuel of every segment follows its speed
+    if segments is not None:
+        scope1_amount = segment_engine.get_amount(model, segments, fuelconsumption)
+        scope3_amount = scope1_amount
+
+    # multiplies the amount of fuel with the co2equivalent and the gases of the fueltype
+    scope1 = [scope1_amount * coefficient for coefficient in scope1_coefficients]
+    CO2_äquivalent = scope1[0]
+
+    #scope3 ------------------------------------------------------------
+    if wtt_coefficient is not None:
+        wtt_result = wtt_coefficient * scope3_amount
+    else:
+        wtt_result = "no Well to Tank Emissions!"
+    #-------------------------------------------------------------------
+    if "greenhouse_gas_coefficients" in model:
         json_reply = \
             {
-                "scope1": {
-                    "CO2_äquivalent": CO2_äquivalent,
-                    "CO": CO,
-                    "NOx": NOx,
-                    "HC": HC
-                },
+                "scope1": dict(zip(["CO2_äquivalent"] + fuel_models.greenhouse_gases, scope1)),
                 "scope3": {
                     "WTT": wtt_result
                 }
@@ -177,6 +179,17 @@ def lambda_handler(event, context):
         json_reply = \
             {"CO2_äquivalent": CO2_äquivalent
              }
+        # Fuels without greenhouse gas ratios (e.g. LPG) still have a WTT emission
+        if wtt_coefficient is not None:
+            json_reply["scope3"] = {"WTT": wtt_result}
+
+    # Electric cars: emissions of the consumed kwh in the departure country
+    if model.get('electricity_mix'):
+        responseJson = electricity_factors.get_emissions(results['route']['input']["departure_country"], scope1_amount)
+        if responseJson.get('statusCode') == 200:
+            json_reply["electricity"] = responseJson['body']
+        else:
+            json_reply["electricity"] = "no electricity mix for the departure country!"
     # The Data is stored as a real JSON
     json_dump = json.dumps(json_reply)
     return {
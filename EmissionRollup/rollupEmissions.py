@@ -0,0 +1,49 @@
+import emission_rollup
+import emission_store
+import instrumentation
+
+# -------------------------------------------------------------------------------
+# This function keeps the monthly pre-aggregates of the emission_store up to date
+# and answers the queries of the dashboards from them (emission_rollup).
+# Scheduled event (no "month"): adds the parts which were written since the last run.
+# Query: the totals of a month (or of one "day" of it), grouped by "group_by"
+# (mode, fuel, department) and filtered by mode, fuel and department.
+# Example for test: {"month": "2026-10", "group_by": ["department"], "mode": "flight"}
+# -> trips, scope1_t, scope2_t, scope3_t per department
+# {"rebuild": "2026-10"} calculates a month again from all its parts.
+# -------------------------------------------------------------------------------
+
+
+@instrumentation.traced_handler("emissionrollup")
+def lambda_handler(event, context):
+    #Check if the store is configured
+    if not emission_store.prefix:
+        return {
+            'statusCode': 400,
+            'body': "EMISSION_STORE_PREFIX is not defined!"
+        }
+
+    if "rebuild" in event:
+        return {
+            'statusCode': 200,
+            'body': {'month': event["rebuild"], 'parts': emission_rollup.rebuild(event["rebuild"])}
+        }
+
+    if "month" not in event:
+        return {
+            'statusCode': 200,
+            'body': {'parts': emission_rollup.run()}
+        }
+
+    group_by = event.get("group_by", ["department"])
+    unknown = [name for name in group_by if name not in emission_rollup.dimensions]
+    if unknown:
+        return {
+            'statusCode': 400,
+            'body': "group_by has to be one of " + ", ".join(emission_rollup.dimensions) + ": " + ", ".join(unknown)
+        }
+    return {
+        'statusCode': 200,
+        'body': emission_rollup.query(event["month"], group_by, event.get("mode"), event.get("fuel"),
+                                      event.get("department"), event.get("day"))
+    }
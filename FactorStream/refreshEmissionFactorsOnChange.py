@@ -0,0 +1,55 @@
+import database_helper
+import factor_version
+import instrumentation
+
+# -------------------------------------------------------------------------------
+# This function receives the records of the DynamoDB Streams of the factor tables
+# (EmissionFactorsAfterDIN16258 and EmissionFactorsFuel_WTT).
+# The fuel files of the changed fuel types are rewritten at once (database_helper)
+# and the factor_version is bumped afterwards, so warm containers drop exactly the
+# changed factors within a few seconds instead of waiting for their intervall.
+# Example for test: Tools/simulate_factor_stream.py
+# -------------------------------------------------------------------------------
+
+# Tables which have a fuel file in the bucket
+fuel_file_tables = ["EmissionFactorsAfterDIN16258"]
+
+
+@instrumentation.traced_handler("factorstream")
+def lambda_handler(event, context):
+    #Check if records are given
+    if "Records" not in event:
+        return {
+            'statusCode': 400,
+            'body': "Records are not defined!"
+        }
+
+    # table -> changed keys, a batch can change the same item several times
+    changes = {}
+    for record in event["Records"]:
+        # arn:aws:dynamodb:<region>:<account>:table/<table>/stream/<label>
+        table_name = record["eventSourceARN"].split("/")[1]
+        for attribute_value in record["dynamodb"]["Keys"].values():
+            key = list(attribute_value.values())[0]
+            changes.setdefault(table_name, set()).add(key)
+    changes = {table_name: sorted(keys) for table_name, keys in changes.items()}
+    if not changes:
+        return {
+            'statusCode': 200,
+            'body': "no changes"
+        }
+
+    # The files are written before the version is bumped, so the containers
+    # which drop their cache find the new factors
+    for table_name in fuel_file_tables:
+        for fuel_type in changes.get(table_name, []):
+            database_helper.refresh_fuel_file(fuel_type)
+
+    version = factor_version.bump_version(changes)
+    return {
+        'statusCode': 200,
+        'body': {
+            'version': version,
+            'changes': changes
+        }
+    }
@@ -1,7 +1,12 @@
-import json
-import boto3
-import requests
-import database_helper
+import aircraft_catalog
+import async_aws
+import emission_store
+import fan_out
+import function_invoker
+import instrumentation
+import result_cache
+import route_cache
+import vector_math
 
 #-------------------------------------------------------------------------------
 # Author: JBoba, NMunoz, YHu
@@ -9,12 +14,33 @@ import database_helper
 # (An IATA is a 3 Digit abbreviation of an Airport) and number of passengers
 # It returns co2 emission in tons as a float
 # Example for test: {"airplane_name": "A380", "fromIATA": "BER", "toIATA": "FRA","passenger": 2} -> CO2_in_t
+#
+# Batch mode: instead of a single trip a list of legs can be sent
+# Example for test: {"legs": [{"airplane_name": "A380", "fromIATA": "BER", "toIATA": "FRA", "passenger": 2},
+#                             {"airplane_name": "A320", "fromIATA": "FRA", "toIATA": "BER"}]}
+# -> per leg results plus the summed up emissions of all legs
+# Distances of routes which were calculated before come from the route_cache,
+# the seats and emission curves of the aircrafts from the aircraft_catalog.
+# Repeated requests are answered from the result_cache.
+# Successful trips are recorded in the emission_store (EMISSION_STORE_PREFIX).
+# lambda_handler_async is the same handler for the asyncio execution mode.
 #-------------------------------------------------------------------------------
 
-dynamodb = boto3.resource('dynamodb')
-client = boto3.client('lambda')
+#Pollutants of the reply, they are scaled down to the passengers of a flight
+#as one vector (see vector_math)
+pollutants = ["Co2_kg", "NOx_kg", "SOx_kg", "H2O_kg", "CO_kg", "HC_kg", "PM_kg"]
+#Names of the pollutants in the reply of getAirplaneEmissionsByAirplaneIdentifier
+source_pollutants = ["Co2_kg", "NOx_kg", "SOx_kg", "H2O_kg", "CO_kg", "HC_kg", "PM_Total_kg"]
 
+
+@instrumentation.traced_handler("flight")
+@emission_store.recorded_handler("flight")
+@result_cache.cached_handler("flight")
 def lambda_handler(event, context):
+    #Batch mode, if a list of legs is given
+    if "legs" in event:
+        return calculate_legs(event["legs"], context)
+
     #Check if airplane is given
     if "airplane_name" not in event:
         return {
@@ -22,6 +48,13 @@ def lambda_handler(event, context):
             'body': "airplane name is not defined!" 
         }
         
+    #Check if the airports are given
+    if "fromIATA" not in event or "toIATA" not in event:
+        return {
+            'statusCode': 400,
+            'body': "fromIATA and toIATA have to be defined!"
+        }
+
     #Check if passenger is given
     if "passenger" not in event:
         passenger = 1
@@ -31,82 +64,37 @@ def lambda_handler(event, context):
     airplane_name = event["airplane_name"]
 
     # invoke the function calculateDistanceAirports
-    response = client.invoke(
-        FunctionName='arn:aws:lambda:eu-central-1:663325156950:function:calculateDistanceBetweenAirports',
-        InvocationType='RequestResponse',
-        Payload=json.dumps(event),
-    )
-    # receive the Payload file and transfer it to Json format
-    responseJson = json.load(response['Payload'])
-    body_json = responseJson['body']
-    distance = body_json['distanceInKM']
-    
-    inputForInvoker = {'distance': distance, 'airplane_name': airplane_name}
+    distance = get_distance(event["fromIATA"], event["toIATA"])
+    if distance is None:
+        return {
+            'statusCode': 400,
+            'body': "Wrong abbreviation of airport: " + event["fromIATA"] + " - " + event["toIATA"]
+        }
     
     # invoke the function getAirplaneEmissionsByAirplaneIdentifier
-    response = client.invoke(
-        FunctionName='arn:aws:lambda:eu-central-1:663325156950:function:getAirplaneEmissionsByAirplaneIdentifier',
-        InvocationType='RequestResponse',
-        Payload=json.dumps(inputForInvoker),
-    )
-    # receive the Payload file and transfer it to Json format
-    responseJson = json.load(response['Payload'])
+    responseJson = get_airplane_emissions(airplane_name, distance)
     body_json = responseJson['body']
     Flight_Emission_json = body_json['Flight_Emission']
     body_json_LTO = body_json['LTO_Emission']
     statusCode = responseJson['statusCode']
     
-    table = dynamodb.Table("AircraftCapacity")
-    response = table.get_item(
-        Key={
-            'Aircraft': airplane_name  # returns the item of the chosen aircraft
+    # returns the seats of the chosen aircraft
+    seatsofplane = aircraft_catalog.get_seats(airplane_name)
+    if seatsofplane is None:
+        return {
+            'statusCode': 400,
+            'body': "airplane not found: " + airplane_name
         }
-    )
-    item = response['Item']
-    seatsofplane = item["StandardSeating"] 
 
     if (statusCode == 200):
-        Co2_kg = Flight_Emission_json['Co2_kg'] * float(passenger) / float(seatsofplane)
-        NOx_kg = Flight_Emission_json['NOx_kg'] * float(passenger) / float(seatsofplane)
-        SOx_kg = Flight_Emission_json['SOx_kg'] * float(passenger) / float(seatsofplane)
-        H2O_kg = Flight_Emission_json['H2O_kg'] * float(passenger) / float(seatsofplane)
-        CO_kg = Flight_Emission_json['CO_kg']   * float(passenger) / float(seatsofplane)
-        HC_kg = Flight_Emission_json['HC_kg']   * float(passenger) / float(seatsofplane)
-        PM_kg = Flight_Emission_json['PM_Total_kg']   * float(passenger) / float(seatsofplane)
-        
-        Co2_kg_LTO = body_json_LTO['Co2_kg'] * float(passenger) / float(seatsofplane)
-        NOx_kg_LTO = body_json_LTO['NOx_kg'] * float(passenger) / float(seatsofplane)
-        SOx_kg_LTO = body_json_LTO['SOx_kg'] * float(passenger) / float(seatsofplane)
-        H2O_kg_LTO = body_json_LTO['H2O_kg'] * float(passenger) / float(seatsofplane)
-        CO_kg_LTO = body_json_LTO['CO_kg']   * float(passenger) / float(seatsofplane)
-        HC_kg_LTO = body_json_LTO['HC_kg']   * float(passenger) / float(seatsofplane)
-        PM_kg_LTO = body_json_LTO['PM_Total_kg']   * float(passenger) / float(seatsofplane)
-        
-        json_Flight_Emission_reply = \
-            {"Co2_kg": Co2_kg,
-            "NOx_kg": NOx_kg,
-            "SOx_kg": SOx_kg,
-            "H2O_kg": H2O_kg,
-            "HC_kg": HC_kg,
-            "PM_kg": PM_kg
-            }
-             
-        json_LTO_reply = \
-            {"Co2_kg": Co2_kg_LTO,
-            "NOx_kg": NOx_kg_LTO,
-            "SOx_kg": SOx_kg_LTO,
-            "H2O_kg": H2O_kg_LTO,
-            "HC_kg": HC_kg_LTO,
-            "PM_kg": PM_kg_LTO
-            }
-        
-        # The Data is stored as JSON format
-        json_dump = json.dumps(json_Flight_Emission_reply)
-        json_dump_LTO = json.dumps(json_LTO_reply)
+        # Flight and LTO emissions are scaled in one operation
+        share = float(passenger) / float(seatsofplane)
+        Flight_Emission, LTO_Emission = vector_math.scale_rows(
+            [emission_vector(Flight_Emission_json), emission_vector(body_json_LTO)], [share, share])
         return {
             'statusCode': 200,
-            'Flight_Emission': json.loads(json_dump),
-            'LTO_Emission': json.loads(json_dump_LTO)
+            'Flight_Emission': dict(zip(pollutants, Flight_Emission)),
+            'LTO_Emission': dict(zip(pollutants, LTO_Emission))
              }
     else:
         # TODO: All kind of error codes
@@ -116,5 +104,178 @@ def lambda_handler(event, context):
         }
 
 
+#asyncio execution mode (see async_aws), e.g. for bulk jobs with many batches
+@instrumentation.traced_handler("flight")
+@emission_store.recorded_handler("flight")
+@result_cache.cached_handler("flight")
+async def lambda_handler_async(event, context):
+    if "legs" in event:
+        return await calculate_legs_async(event["legs"], context)
+    # The lookups of a single trip depend on each other, it runs on the thread pool
+    return await async_aws.run(lambda_handler, event, context)
+
+
+#Invokes calculateDistanceBetweenAirports once for a route and returns the distance
+#in km, or None if the airports are not known
+def get_distance(fromIATA, toIATA):
+    inputForInvoker = {'fromIATA': fromIATA, 'toIATA': toIATA}
+    responseJson = route_cache.get_route(fromIATA, toIATA, "flight",
+        lambda: function_invoker.invoke('calculateDistanceBetweenAirports', inputForInvoker))
+    if responseJson.get('statusCode') != 200:
+        return None
+    return responseJson['body']['distanceInKM']
+
+
+#Emissions of getAirplaneEmissionsByAirplaneIdentifier for an airplane and distance,
+#interpolated from the emission curve of the airplane (aircraft_catalog)
+def get_airplane_emissions(airplane_name, distance):
+    def invoke(sample_distance):
+        inputForInvoker = {'distance': sample_distance, 'airplane_name': airplane_name}
+        return function_invoker.invoke('getAirplaneEmissionsByAirplaneIdentifier', inputForInvoker)
+    return aircraft_catalog.get_emissions(airplane_name, distance, invoke)
+
+
+#Returns the StandardSeating of all given aircrafts from the aircraft_catalog
+def get_seats_of_aircrafts(airplane_names):
+    seats = {name: aircraft_catalog.get_seats(name) for name in airplane_names}
+    return {name: seatsofplane for name, seatsofplane in seats.items() if seatsofplane is not None}
+
+
+#Returns the emissions of the invoked function as vector in the order of pollutants
+def emission_vector(emissions):
+    return [emissions[source_pollutant] for source_pollutant in source_pollutants]
 
 
+#Batch mode: calculates the emissions of many legs. Identical routes and
+#(airplane, route) pairs are only calculated once, all of them at the same time
+#(fan_out).
+def calculate_legs(legs, context=None):
+    if not isinstance(legs, list):
+        return {
+            'statusCode': 400,
+            'body': "legs has to be a list!"
+        }
+    errors, lookups = get_distance_lookups(legs)
+    distances, failed = fan_out.fan_out(lookups, fan_out.get_timeout(context))
+    lookups = get_emission_lookups(legs, errors, distances, failed)
+    results, failed = fan_out.fan_out(lookups, fan_out.get_timeout(context))
+    return get_legs_reply(legs, errors, results, failed)
+
+
+#Same as calculate_legs, the lookups run on the event loop (see async_aws)
+async def calculate_legs_async(legs, context=None):
+    if not isinstance(legs, list):
+        return {
+            'statusCode': 400,
+            'body': "legs has to be a list!"
+        }
+    errors, lookups = get_distance_lookups(legs)
+    distances, failed = await async_aws.gather(lookups, fan_out.get_timeout(context))
+    lookups = get_emission_lookups(legs, errors, distances, failed)
+    results, failed = await async_aws.gather(lookups, fan_out.get_timeout(context))
+    return get_legs_reply(legs, errors, results, failed)
+
+
+#Checks the legs, returns the errors of the legs and the lookups of the distances
+def get_distance_lookups(legs):
+    errors = {}
+    lookups = {}
+    for index, leg in enumerate(legs):
+        if not isinstance(leg, dict):
+            errors[index] = "leg has to be an object!"
+            continue
+        missing = [field for field in ("airplane_name", "fromIATA", "toIATA") if field not in leg]
+        if missing:
+            errors[index] = ", ".join(missing) + " is not defined!"
+            continue
+        not_text = [field for field in ("airplane_name", "fromIATA", "toIATA") if not isinstance(leg[field], str)]
+        if not_text:
+            errors[index] = ", ".join(not_text) + " has to be a text!"
+            continue
+        if not is_number(leg.get("passenger", 1)):
+            errors[index] = "passenger has to be a number!"
+            continue
+        route = (leg["fromIATA"], leg["toIATA"])
+        lookups[route] = (get_distance,) + route
+    return errors, lookups
+
+
+def is_number(value):
+    try:
+        float(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+#Lookups of the emissions of every (airplane, route) pair and of the capacities
+def get_emission_lookups(legs, errors, distances, failed):
+    lookups = {}
+    for index, leg in enumerate(legs):
+        if index in errors:
+            continue
+        route = (leg["fromIATA"], leg["toIATA"])
+        if distances.get(route) is None:
+            errors[index] = failed.get(route, "Wrong abbreviation of airport: " + " - ".join(route))
+            continue
+        pair = (leg["airplane_name"],) + route
+        lookups[pair] = (get_airplane_emissions, leg["airplane_name"], distances[route])
+    lookups["seats"] = (get_seats_of_aircrafts, {pair[0] for pair in lookups})
+    return lookups
+
+
+#Builds the reply of the batch mode from the results of the lookups
+def get_legs_reply(legs, errors, lookup_results, failed):
+    seats = lookup_results.get("seats", {})
+
+    #All legs are checked first, then the emissions of all valid legs are scaled
+    #down to their passengers in one array operation
+    results = []
+    valid_legs = []
+    Flight_rows = []
+    LTO_rows = []
+    shares = []
+    for index, leg in enumerate(legs):
+        if index in errors:
+            results.append({'statusCode': 400, 'body': errors[index]})
+            continue
+        airplane_name = leg["airplane_name"]
+        pair = (airplane_name, leg["fromIATA"], leg["toIATA"])
+        if pair not in lookup_results:
+            results.append({'statusCode': 400, 'body': failed.get(pair)})
+            continue
+        responseJson = lookup_results[pair]
+        statusCode = responseJson['statusCode']
+        if statusCode != 200:
+            results.append({'statusCode': 400, 'body': "Wrong abbreviation of airport: " + str(statusCode)})
+            continue
+        if airplane_name not in seats:
+            results.append({'statusCode': 400, 'body': "airplane not found: " + airplane_name})
+            continue
+
+        valid_legs.append(len(results))
+        results.append(None)
+        Flight_rows.append(emission_vector(responseJson['body']['Flight_Emission']))
+        LTO_rows.append(emission_vector(responseJson['body']['LTO_Emission']))
+        shares.append(float(leg.get("passenger", 1)) / float(seats[airplane_name]))
+
+    scaled = vector_math.scale_rows(Flight_rows + LTO_rows, shares + shares)
+    Flight_scaled = scaled[:len(valid_legs)]
+    LTO_scaled = scaled[len(valid_legs):]
+    for position, Flight_Emission, LTO_Emission in zip(valid_legs, Flight_scaled, LTO_scaled):
+        results[position] = {
+            'statusCode': 200,
+            'Flight_Emission': dict(zip(pollutants, Flight_Emission)),
+            'LTO_Emission': dict(zip(pollutants, LTO_Emission))
+        }
+
+    return {
+        'statusCode': 200,
+        'legs': results,
+        'total': {
+            'legs': len(valid_legs),
+            'failedLegs': len(results) - len(valid_legs),
+            'Flight_Emission': dict(zip(pollutants, vector_math.column_sums(Flight_scaled, len(pollutants)))),
+            'LTO_Emission': dict(zip(pollutants, vector_math.column_sums(LTO_scaled, len(pollutants))))
+        }
+    }
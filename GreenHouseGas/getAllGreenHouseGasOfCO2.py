@@ -1,46 +1,31 @@
-import json
-import boto3
+import emission_calculator
+import instrumentation
 
+# -------------------------------------------------------------------------------
+# This function receives the CO2 emission of a Diesel or Petrol car and returns
+# the CO, NOx and HC emissions. The calculation itself is part of the shared
+# layer (emission_calculator), so the car function can call it in-process.
+# Example for test: {"CO2": 0.5, "fuel": "Diesel"} -> CO, NOx, HC
+#
+# Batch mode: instead of a single CO2 value a list of trips can be sent
+# Example for test: {"trips": [{"CO2": 0.5, "fuel": "Diesel"}, {"CO2": 0.2, "fuel": "Petrol"}]}
+# -> CO, NOx, HC per trip
+# -------------------------------------------------------------------------------
+
+@instrumentation.traced_handler("greenhousegas")
 def lambda_handler(event, context):
+    #Batch mode, if a list of trips is given
+    if "trips" in event:
+        if not isinstance(event["trips"], list):
+            return {
+                'statusCode': 400,
+                'body': "trips has to be a list!"
+            }
+        return {
+            'statusCode': 200,
+            'trips': emission_calculator.get_all_greenhouse_gas_of_co2_batch(event["trips"])
+        }
+
     fuel = event["fuel"]
     CO2 = event["CO2"]
-    if (fuel =='Diesel' or fuel == 'Petrol'):
-        if (fuel == 'Diesel'):
-            # Scope1-TankToWheel-Diesel
-            CO2 = CO2 / 12
-            CO = CO2 * 0.8
-            NOx = CO2 * 0.12
-            HC = CO2 * 0.08
-            json_reply = \
-                {
-                    "CO": CO,
-                    "NOx": NOx,
-                    "HC": HC
-                    
-                }
-        if (fuel == 'Petrol'):
-            # Scope1-TankToWheel-Benzin
-            CO2 = CO2 / 8
-            CO2 = CO2 / 5
-            CO = CO2 * 0.2
-            NOx = CO2 * 0.55
-            HC = CO2 * 0.1
-            json_reply = \
-                {
-                    "CO": CO,
-                    "NOx": NOx,
-                    "HC": HC
-                    
-                }
-    else : 
-        return {
-        'statusCode': 400,
-        'body': fuel + "is not allowed"
-    }
-    
-    # The Data is stored as a real JSON
-    json_dump = json.dumps(json_reply)
-    return {
-        'statusCode': 200,
-        'body': json.loads(json_dump)  # returns co2 in t emission as a float (NOT A JSON!!)
-    }
+    return emission_calculator.get_all_greenhouse_gas_of_co2(CO2, fuel)
@@ -0,0 +1,159 @@
+import bisect
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aws_clients
+import factor_version
+import instrumentation
+
+#-------------------------------------------------------------------------------
+# Aircraft data of the flight handler, kept in memory per container.
+# The capacity table AircraftCapacity is small, it is read completely with the
+# first request (scan) and again after refresh_seconds or when the factor_version
+# reports a change of the table.
+# The emissions of getAirplaneEmissionsByAirplaneIdentifier only depend on the
+# aircraft and the distance. The function is called for the distances of
+# distance_grid_km only, and only for the two grid distances around a requested
+# flight: every sample is kept in memory, so a new container pays two invokes
+# (at the same time) for a new aircraft and distance band, not one per grid
+# distance. A flight between two grid distances is interpolated linearly, so
+# its emissions are an approximation: they are exact only where the function is
+# linear in the distance between the two bands. A flight on a grid distance gets
+# the reply of the function. The LTO emissions do not depend on the distance.
+# Distances outside the grid, aircraft which are not in the capacity table and
+# aircraft the function does not know are passed to the function as before.
+# Example: get_emissions("A380", 545.0, fetch) -> same reply as the function
+#-------------------------------------------------------------------------------
+
+# Distance bands (km) of the EEA emission tables the function is based on
+distance_grid_km = [125, 250, 500, 750, 1000, 1500, 2000, 2500, 3000, 3500, 4000, 4500,
+                    5000, 5500, 6000, 6500, 7000, 7500, 8000, 8500, 9000, 9500, 10000,
+                    11000, 12000, 13000, 14000, 15000, 16000]
+refresh_seconds = 6 * 60 * 60
+# Threads which sample the two grid distances of a flight at the same time
+sample_workers = 8
+
+capacity_table = "AircraftCapacity"
+capacities = {}  # aircraft -> StandardSeating
+capacities_loaded_at = 0
+capacities_lock = threading.Lock()
+
+# (aircraft, grid distance) -> (loaded at, body of the reply or None if the function does not know the aircraft)
+samples = {}
+sample_locks = {}
+sample_locks_lock = threading.Lock()
+sample_executor = None
+
+
+# Reloads the capacities if their table changed (see factor_version)
+def invalidate_capacities(changes):
+    global capacities_loaded_at
+    if changes is None or capacity_table in changes:
+        capacities_loaded_at = 0
+
+
+factor_version.add_listener(invalidate_capacities)
+
+
+# Reads the whole capacity table, a scan returns at most 1 MB per page
+def load_capacities():
+    global capacities, capacities_loaded_at
+    table = aws_clients.table(capacity_table)
+    loaded = {}
+    arguments = {}
+    while True:
+        with instrumentation.span("dynamodb", "scan"):
+            response = table.scan(**arguments)
+        for item in response['Items']:
+            loaded[item["Aircraft"]] = item["StandardSeating"]
+        if 'LastEvaluatedKey' not in response:
+            break
+        arguments['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    capacities = loaded
+    capacities_loaded_at = time.time()
+
+
+# Returns the StandardSeating of the aircraft, None if it is not in the table
+def get_seats(airplane_name):
+    factor_version.check()
+    if time.time() - capacities_loaded_at >= refresh_seconds:
+        with capacities_lock:
+            if time.time() - capacities_loaded_at >= refresh_seconds:
+                load_capacities()
+                instrumentation.record_cache("aircraft_capacity", "miss")
+    else:
+        instrumentation.record_cache("aircraft_capacity", "hit")
+    return capacities.get(airplane_name)
+
+
+def get_sample_lock(sample_key):
+    with sample_locks_lock:
+        return sample_locks.setdefault(sample_key, threading.Lock())
+
+
+# Returns the emissions of the aircraft at a distance of the grid, they are
+# requested with the first use. fetch(distance) returns the reply of
+# getAirplaneEmissionsByAirplaneIdentifier.
+def get_sample(airplane_name, grid_distance, fetch):
+    sample_key = (airplane_name, grid_distance)
+    entry = samples.get(sample_key)
+    if entry is not None and time.time() - entry[0] < refresh_seconds:
+        instrumentation.record_cache("emission_curve", "hit")
+        return entry[1]
+    with get_sample_lock(sample_key):
+        entry = samples.get(sample_key)
+        if entry is None or time.time() - entry[0] >= refresh_seconds:
+            instrumentation.record_cache("emission_curve", "miss")
+            reply = fetch(grid_distance)
+            entry = (time.time(), reply['body'] if reply.get('statusCode') == 200 else None)
+            samples[sample_key] = entry
+    return entry[1]
+
+
+# Returns the samples of the lower and the upper grid distance, missing ones are requested at the same time
+def get_samples(airplane_name, lower, upper, fetch):
+    global sample_executor
+    if sample_executor is None:
+        sample_executor = ThreadPoolExecutor(max_workers=sample_workers)
+    # The upper sample runs in a copy of the context, so it is traced as part of the invocation
+    upper_future = sample_executor.submit(contextvars.copy_context().run, get_sample, airplane_name, upper, fetch)
+    return get_sample(airplane_name, lower, fetch), upper_future.result()
+
+
+# Same reply as getAirplaneEmissionsByAirplaneIdentifier for the aircraft and
+# distance in km, interpolated between the two grid distances around it
+def get_emissions(airplane_name, distance, fetch):
+    distance = float(distance)
+    # Only aircrafts of the capacity table are sampled
+    if distance < distance_grid_km[0] or distance > distance_grid_km[-1] or get_seats(airplane_name) is None:
+        return fetch(distance)
+
+    upper = bisect.bisect_left(distance_grid_km, distance)
+    if distance_grid_km[upper] == distance:
+        body = get_sample(airplane_name, distance_grid_km[upper], fetch)
+        if body is None:
+            return fetch(distance)
+        return {
+            'statusCode': 200,
+            'body': {
+                'Flight_Emission': dict(body['Flight_Emission']),
+                'LTO_Emission': dict(body['LTO_Emission'])
+            }
+        }
+
+    lower = upper - 1
+    lower_body, upper_body = get_samples(airplane_name, distance_grid_km[lower], distance_grid_km[upper], fetch)
+    if lower_body is None or upper_body is None:
+        return fetch(distance)
+    share = (distance - distance_grid_km[lower]) / (distance_grid_km[upper] - distance_grid_km[lower])
+    upper_values = upper_body['Flight_Emission']
+    return {
+        'statusCode': 200,
+        'body': {
+            'Flight_Emission': {name: low + (upper_values[name] - low) * share
+                                for name, low in lower_body['Flight_Emission'].items()},
+            'LTO_Emission': dict(lower_body['LTO_Emission'])
+        }
+    }
@@ -0,0 +1,97 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import aws_clients
+
+#-------------------------------------------------------------------------------
+# asyncio execution mode of the handlers.
+# boto3 has no async API, so the handlers run their blocking lookups with run:
+# a call runs on a thread pool of pool_size threads and the event loop awaits it,
+# while at most concurrency_limit calls are in flight at once. gather has the
+# same contract as fan_out.fan_out, so a handler can build its lookups once and
+# run them either on the fan_out threads or on the event loop.
+# ASYNC_CONCURRENCY_LIMIT and ASYNC_POOL_SIZE override the defaults.
+# asyncio is only imported by the handlers which run in the asyncio mode.
+# Example:
+#   results, errors = await async_aws.gather({"route": (get_route, origin, destination)}, 2.5)
+#-------------------------------------------------------------------------------
+
+concurrency_limit = int(os.environ.get("ASYNC_CONCURRENCY_LIMIT", "64"))
+pool_size = int(os.environ.get("ASYNC_POOL_SIZE", "32"))
+
+executor = None
+executor_lock = threading.Lock()
+# event loop -> semaphore of the concurrency limit, a semaphore belongs to one loop
+semaphores = {}
+
+
+# Changes the limits, the thread pool is created again with its next use
+def configure(new_concurrency_limit=None, new_pool_size=None):
+    global concurrency_limit, pool_size, executor
+    if new_concurrency_limit is not None:
+        concurrency_limit = new_concurrency_limit
+        semaphores.clear()
+    if new_pool_size is not None:
+        pool_size = new_pool_size
+        # Every thread of the pool needs its own connection
+        aws_clients.set_max_pool_connections(new_pool_size)
+        with executor_lock:
+            if executor is not None:
+                executor.shutdown(wait=False)
+            executor = None
+
+
+def get_executor():
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="async_aws")
+        return executor
+
+
+def get_semaphore():
+    import asyncio
+    loop = asyncio.get_running_loop()
+    semaphore = semaphores.get(loop)
+    if semaphore is None:
+        # Semaphores of loops which are closed are not needed any more
+        for closed_loop in [closed_loop for closed_loop in semaphores if closed_loop.is_closed()]:
+            del semaphores[closed_loop]
+        semaphore = asyncio.Semaphore(concurrency_limit)
+        semaphores[loop] = semaphore
+    return semaphore
+
+
+# Runs a blocking function on the thread pool and awaits its result. The call
+# runs in a copy of the context, so it is traced as part of its invocation.
+async def run(function, *arguments):
+    import asyncio
+    async with get_semaphore():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), contextvars.copy_context().run, function, *arguments)
+
+
+# Runs all lookups concurrently, lookups is a dict: name -> (function, arguments...)
+# Returns a dict name -> result and a dict name -> error message, like fan_out
+async def gather(lookups, timeout):
+    import asyncio
+    tasks = {name: asyncio.ensure_future(run(function, *arguments))
+             for name, (function, *arguments) in lookups.items()}
+    if not tasks:
+        return {}, {}
+    done, not_done = await asyncio.wait(tasks.values(), timeout=timeout)
+
+    results = {}
+    errors = {}
+    for name, task in tasks.items():
+        if task in not_done:
+            task.cancel()
+            errors[name] = "no reply within %.1f seconds" % timeout
+        elif task.exception() is not None:
+            errors[name] = type(task.exception()).__name__ + ": " + str(task.exception())
+        else:
+            results[name] = task.result()
+    return results, errors
+
@@ -0,0 +1,93 @@
+import os
+import threading
+
+#-------------------------------------------------------------------------------
+# One place to create the boto3 clients and resources of all functions.
+# Every client is created with its first use and then reused by all warm
+# invocations of the container, so its connections (and TLS sessions) are kept
+# open. boto3 itself is only imported with the first client, an import of a
+# module which never reaches AWS does not pay for it.
+# The botocore config keeps connections alive, has as many connections per pool
+# as the handlers run calls at the same time (fan_out, async_aws), retries with
+# the adaptive mode and fails fast if a service does not answer.
+# Example: aws_clients.table("AircraftCapacity").scan()
+#-------------------------------------------------------------------------------
+
+# async_aws runs up to 32 calls at the same time, fan_out 8
+max_pool_connections = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "32"))
+connect_timeout_seconds = float(os.environ.get("AWS_CONNECT_TIMEOUT", "1"))
+# Invoked functions do their own work, DynamoDB and S3 answer within milliseconds
+read_timeout_seconds = {"lambda": 10, "dynamodb": 2, "s3": 3}
+default_read_timeout_seconds = 5
+max_attempts = 3
+
+clients = {}
+resources = {}
+tables = {}
+buckets = {}
+lock = threading.Lock()
+
+
+def get_config(service_name):
+    from botocore.config import Config
+    return Config(
+        connect_timeout=connect_timeout_seconds,
+        read_timeout=read_timeout_seconds.get(service_name, default_read_timeout_seconds),
+        max_pool_connections=max_pool_connections,
+        tcp_keepalive=True,
+        retries={"max_attempts": max_attempts, "mode": "adaptive"},
+    )
+
+
+# Raises the size of the connection pools, e.g. for a bulk job with more
+# concurrent calls. It is used by the clients which are created afterwards.
+def set_max_pool_connections(connections):
+    global max_pool_connections
+    max_pool_connections = max(max_pool_connections, connections)
+
+
+def client(service_name):
+    existing = clients.get(service_name)
+    if existing is not None:
+        return existing
+    with lock:
+        if service_name not in clients:
+            import boto3
+            clients[service_name] = boto3.client(service_name, config=get_config(service_name))
+        return clients[service_name]
+
+
+def resource(service_name):
+    existing = resources.get(service_name)
+    if existing is not None:
+        return existing
+    with lock:
+        if service_name not in resources:
+            import boto3
+            resources[service_name] = boto3.resource(service_name, config=get_config(service_name))
+        return resources[service_name]
+
+
+# The DynamoDB table of the shared resource
+def table(table_name):
+    existing = tables.get(table_name)
+    if existing is None:
+        existing = tables.setdefault(table_name, resource("dynamodb").Table(table_name))
+    return existing
+
+
+# The S3 bucket of the shared resource
+def bucket(bucket_name):
+    existing = buckets.get(bucket_name)
+    if existing is None:
+        existing = buckets.setdefault(bucket_name, resource("s3").Bucket(bucket_name))
+    return existing
+
+
+# Error code of a rejected AWS request (botocore ClientError), None for other
+# exceptions. botocore does not have to be imported for it.
+def get_error_code(error):
+    response = getattr(error, "response", None)
+    if not isinstance(response, dict):
+        return None
+    return response.get("Error", {}).get("Code")
@@ -0,0 +1,139 @@
+import gzip
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import aws_clients
+import instrumentation
+
+#-------------------------------------------------------------------------------
+#Author: SVincenti, ABusch
+#Fuel files in the S3 Bucket: one JSON file per fuel type with the items of the
+#table EmissionFactorsAfterDIN16258, so other consumers do not have to read the
+#database. The handlers read their factors through the factor_repository.
+#Changes of the table are pushed by the FactorStream function: it rewrites the
+#fuel file (refresh_fuel_file) and bumps the factor_version. If the factors did
+#not change, only the time of the refresh is updated (metadata "refreshed-at")
+#instead of writing the file again.
+#-------------------------------------------------------------------------------
+
+#The database, its table is created with the first database access (aws_clients)
+table_name = "EmissionFactorsAfterDIN16258"
+
+#The fuel files are stored as JSON, set FUEL_FILE_COMPRESSION to "gzip" to
+#store them compressed. Both are read, also files which were encoded twice.
+compression = os.environ.get("FUEL_FILE_COMPRESSION", "")
+
+
+#Timestamps are written with str(datetime), without microseconds if they are 0
+def parse_timestamp(text):
+    try:
+        return datetime.strptime(text, '%Y-%m-%d %H:%M:%S.%f')
+    except ValueError:
+        return datetime.strptime(text, '%Y-%m-%d %H:%M:%S')
+
+
+#Database search function to get the data of a fuel type directly from DynamoDB
+def get_data_from_database(fuel_type):
+    #boto3 is only imported with the first database access
+    from boto3.dynamodb.conditions import Key
+    with instrumentation.span("dynamodb", "query"):
+        fuelQuery = get_table().query(KeyConditionExpression=Key('fuel_type').eq(fuel_type))
+    fuelResponse = fuelQuery['Items']
+    #If the value is not found in the database
+    if not fuelResponse:
+        return {
+            'statusCode': 400,
+            'body': {
+                'error': "fuel type not found in Database",
+                'wrongFuelType': fuel_type
+            }
+        }
+    file_content = {
+        "timestamp": datetime.now(),
+        "fuel_values": fuelResponse
+    }
+    return json.dumps(file_content, default=str)
+
+
+#Hash of the factors of a fuel file, the timestamp is not part of it
+def get_content_hash(data):
+    fuel_values = json.loads(data)["fuel_values"]
+    return hashlib.sha256(json.dumps(fuel_values, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+#Reads a fuel file. Returns the data (a JSON string), the time of its last
+#refresh, its ETag and if it is stored in the current format.
+def read_fuel_file(s3, fuel_file_name):
+    with instrumentation.span("s3", "get") as details:
+        response = s3.Object(key=fuel_file_name).get()
+        body = response["Body"].read()
+        if details is not None:
+            details["response_bytes"] = len(body)
+    compressed = response.get("ContentEncoding") == "gzip" or body[:2] == b"\x1f\x8b"
+    if compressed:
+        body = gzip.decompress(body)
+    data = body.decode("utf-8")
+    content = json.loads(data)
+    #Older versions encoded the JSON string of the file a second time
+    encoded_twice = isinstance(content, str)
+    if encoded_twice:
+        data = content
+        content = json.loads(content)
+    refreshed_at = response.get("Metadata", {}).get("refreshed-at", content["timestamp"])
+    current_format = not encoded_twice and compressed == (compression == "gzip")
+    return data, parse_timestamp(refreshed_at), response.get("ETag"), current_format
+
+
+#Writes the fuel file. old_data is the file which is in the bucket in the
+#current format, if its factors are the same only the time of the refresh is updated.
+def write_fuel_file(s3, fuel_file_name, data, old_data, old_etag):
+    metadata = {"refreshed-at": json.loads(data)["timestamp"]}
+    content_encoding = {"ContentEncoding": "gzip"} if compression == "gzip" else {}
+    try:
+        if old_data is not None and get_content_hash(old_data) == get_content_hash(data):
+            with instrumentation.span("s3", "copy"):
+                s3.Object(key=fuel_file_name).copy_from(
+                    CopySource={"Bucket": s3.name, "Key": fuel_file_name}, CopySourceIfMatch=old_etag,
+                    Metadata=metadata, MetadataDirective="REPLACE", ContentType="application/json",
+                    **content_encoding)
+            return
+        body = data.encode("utf-8")
+        if compression == "gzip":
+            body = gzip.compress(body)
+        with instrumentation.span("s3", "put") as details:
+            s3.Object(key=fuel_file_name).put(Body=body, Metadata=metadata, ContentType="application/json",
+                                              **content_encoding)
+            if details is not None:
+                details["request_bytes"] = len(body)
+    except Exception as error:
+        #The file is written again with the next change of the fuel type
+        print("Fuel file could not be written: " + str(error))
+
+
+#The bucket is created with the first access and reused afterwards
+def get_bucket():
+    #Source: https://stackoverflow.com/questions/40336918/how-to-write-a-file-or-data-to-an-s3-object-using-boto3
+    return aws_clients.bucket("emissionfactorsbucket")
+
+
+#The table is created with the first database access and reused afterwards
+def get_table():
+    return aws_clients.table(table_name)
+
+
+#Reads the fuel type from the database and rewrites its fuel file at once,
+#called when the table changed (see FactorStream)
+def refresh_fuel_file(fuel_type):
+    data = get_data_from_database(fuel_type)
+    if not isinstance(data, str):
+        return data
+    s3 = get_bucket()
+    fuel_file_name = fuel_type + '.json'
+    try:
+        old_data, refreshed_at, etag, current_format = read_fuel_file(s3, fuel_file_name)
+    except Exception:
+        old_data, etag, current_format = None, None, False
+    write_fuel_file(s3, fuel_file_name, data, old_data if current_format else None, etag)
+    return data
@@ -0,0 +1,66 @@
+import os
+import threading
+import time
+
+import function_invoker
+import instrumentation
+
+#-------------------------------------------------------------------------------
+# Per-country cache of the electricity mix.
+# The emissions of calculateEmissionsForElectricityByCountry are linear in the
+# kwh, therefore the function is called once per country for 1 kwh and the
+# result is scaled locally to the consumption of every trip. A country is read
+# again after factor_max_age_seconds or when the version of the dataset changes
+# (ELECTRICITY_FACTORS_VERSION or set_version), so electric trips of warm
+# containers do not pay a Lambda call per request.
+# Example: get_emissions("DE", 120.5) -> same reply as calculateEmissionsForElectricityByCountry
+#-------------------------------------------------------------------------------
+
+# Values of the reply of calculateEmissionsForElectricityByCountry
+electricity_values = ["directCO2min", "directCO2med", "directCO2max", "methaneCO2e", "biogenicCO2e", "waterConsumptionInL"]
+
+# The dataset of the electricity mix is updated rarely
+factor_max_age_seconds = 6 * 60 * 60
+# Version of the dataset, a new version invalidates all countries
+version = os.environ.get("ELECTRICITY_FACTORS_VERSION", "")
+
+# country -> (loaded at, version, emissions of 1 kwh)
+mixes = {}
+lock = threading.Lock()
+
+
+# Changes the version of the dataset, the countries are read again with their next use
+def set_version(new_version):
+    global version
+    version = new_version
+
+
+# Returns the reply of calculateEmissionsForElectricityByCountry for 1 kwh of the
+# country. Only successful replies are cached.
+def get_mix(country):
+    with lock:
+        entry = mixes.get(country)
+    if entry is not None and entry[1] == version and time.time() - entry[0] < factor_max_age_seconds:
+        instrumentation.record_cache("electricity_mix", "hit")
+        return {'statusCode': 200, 'body': entry[2]}
+    instrumentation.record_cache("electricity_mix", "miss")
+
+    loaded_version = version
+    inputForInvoker = {'country': country, 'kWh': 1, "green_electricity": 0}
+    responseJson = function_invoker.invoke('calculateEmissionsForElectricityByCountry', inputForInvoker)
+    if responseJson.get('statusCode') == 200:
+        body = {name: responseJson['body'][name] for name in electricity_values}
+        with lock:
+            mixes[country] = (time.time(), loaded_version, body)
+    return responseJson
+
+
+# Same reply as calculateEmissionsForElectricityByCountry for the consumption in kwh
+def get_emissions(country, kWh):
+    responseJson = get_mix(country)
+    if responseJson.get('statusCode') != 200:
+        return responseJson
+    return {
+        'statusCode': 200,
+        'body': {name: responseJson['body'][name] * kWh for name in electricity_values}
+    }
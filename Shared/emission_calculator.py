@@ -0,0 +1,98 @@
+#-------------------------------------------------------------------------------
+# Calculations which are shared by the emission functions.
+# They are pure arithmetic, therefore the handlers call them directly instead
+# of invoking another Lambda function for them. Only the standard library is
+# used, so the module can be imported by every function of the layer.
+#-------------------------------------------------------------------------------
+
+import fuel_models
+import vector_math
+
+# Greenhouse gases of a car, calculated from its CO2 emission
+greenhouse_gases = fuel_models.greenhouse_gases
+# fuel -> (divisor of the CO2, ratios of CO, NOx and HC), see fuel_models
+greenhouse_gas_ratios = fuel_models.get_greenhouse_gas_ratios()
+
+# Same reply as the Lambda function getAllGreenHouseGasOfCO2
+# Example for test: get_all_greenhouse_gas_of_co2(0.5, "Diesel") -> CO, NOx, HC
+def get_all_greenhouse_gas_of_co2(CO2, fuel):
+    if fuel not in greenhouse_gas_ratios:
+        return {
+            'statusCode': 400,
+            'body': str(fuel) + "is not allowed"
+        }
+
+    divisor, ratios = greenhouse_gas_ratios[fuel]
+    CO2 = CO2 / divisor
+    return {
+        'statusCode': 200,
+        'body': {gas: CO2 * ratio for gas, ratio in zip(greenhouse_gases, ratios)}
+    }
+
+
+# Returns why a trip of the batch cannot be calculated, None if it can
+def get_trip_error(trip):
+    if not isinstance(trip, dict):
+        return "trip has to be an object!"
+    if "CO2" not in trip:
+        return "CO2 is not defined!"
+    fuel = trip.get("fuel")
+    if not isinstance(fuel, str) or fuel not in greenhouse_gas_ratios:
+        return str(fuel) + "is not allowed"
+    if not isinstance(trip["CO2"], (int, float)) or isinstance(trip["CO2"], bool):
+        return "CO2 has to be a number!"
+    return None
+
+
+# Batch version for many {"CO2", "fuel"} pairs, the trips are grouped by fuel
+# and the gases of every group are calculated in one array operation.
+# Returns one reply per trip, in the same order.
+def get_all_greenhouse_gas_of_co2_batch(trips):
+    replies = [None] * len(trips)
+    groups = {}
+    for index, trip in enumerate(trips):
+        error = get_trip_error(trip)
+        if error is not None:
+            replies[index] = {
+                'statusCode': 400,
+                'body': error
+            }
+            continue
+        groups.setdefault(trip["fuel"], []).append(index)
+
+    for fuel, indices in groups.items():
+        divisor, ratios = greenhouse_gas_ratios[fuel]
+        gases = vector_math.outer([trips[index]["CO2"] / divisor for index in indices], ratios)
+        for index, values in zip(indices, gases):
+            replies[index] = {
+                'statusCode': 200,
+                'body': dict(zip(greenhouse_gases, values))
+            }
+    return replies
+
+
+# Emissions of one passenger of a diesel bus for the given distance in m, the result is in kg
+# factors: grams per person-kilometer, BusEmissionFactors "diesel" of the factor_repository
+def get_diesel_bus_emissions(distance, factors):
+    return {
+        'Co2EmissionFinal': float(factors["Co2"]) * distance / 1000000,
+        'NOxEmissionFinal': float(factors["NOx"]) * distance / 1000000,
+        'PMEmissionFinal': float(factors["PM"]) * distance / 1000000
+    }
+
+
+# Batch version for the distances (in m) of many diesel bus trips, all
+# emissions (kg per passenger) are calculated in one array operation
+def get_diesel_bus_emissions_batch(distances, factors):
+    values = vector_math.outer(distances, [float(factors["Co2"]), float(factors["NOx"]), float(factors["PM"])])
+    return [{
+        'Co2EmissionFinal': Co2 / 1000000,
+        'NOxEmissionFinal': NOx / 1000000,
+        'PMEmissionFinal': PM / 1000000
+    } for Co2, NOx, PM in values]
+
+
+# Consumption of the whole electric bus in kwh for the given distance in m
+# factors: BusEmissionFactors "electricity" of the factor_repository, in kwh/km
+def get_electric_bus_consumption(distance, factors):
+    return float(factors["consumption"]) * distance / 1000
@@ -0,0 +1,135 @@
+import calendar
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import emission_store
+
+#-------------------------------------------------------------------------------
+# Incremental pre-aggregates of the emission_store for the dashboards.
+# For every month there is one small object in the store
+#   <prefix>/_rollup/month=2026-10.json
+# with the number of trips and the scope1/2/3 emissions (t CO2e) per mode, fuel
+# and department, for the whole month ("total") and per day ("days"). The day
+# is the day the trip was calculated.
+# run adds the parts which were written since the last run: every month object
+# has a watermark, the time (ms) up to which its parts were added. Only parts
+# which are older than settle_seconds are added, so a part which is still being
+# written (at most for the timeout of a Lambda function) is not skipped. The
+# parts and the new watermark are written in one object, so a run which fails
+# adds nothing and the next one starts from the same watermark.
+# query reads one month object, a dashboard never reads the trips themselves.
+# Example: query("2026-10", group_by=["department"], mode="flight")
+#          -> [{"department": "sales", "trips": 12, "scope1_t": 3.1, ...}]
+#-------------------------------------------------------------------------------
+
+settle_seconds = float(os.environ.get("EMISSION_ROLLUP_SETTLE_SECONDS", "900"))
+# A buffered row is written at most this long after its day (see emission_store)
+late_part_seconds = 24 * 60 * 60
+metrics = ["trips", "scope1_t", "scope2_t", "scope3_t"]
+dimensions = ["mode", "fuel", "department"]
+
+
+def month_key(month):
+    return "_rollup/month=%s.json" % month
+
+
+def new_month(month):
+    return {"month": month, "watermark": 0, "parts": 0, "total": {}, "days": {}}
+
+
+# Returns the object of the month, an empty one if there is none yet
+def read_month(month):
+    body = emission_store.read_object(month_key(month))
+    if body is None:
+        return new_month(month)
+    return json.loads(body.decode("utf-8"))
+
+
+def write_month(aggregate):
+    aggregate["updated_at"] = datetime.now(timezone.utc).isoformat()
+    emission_store.write_object(month_key(aggregate["month"]), json.dumps(aggregate).encode("utf-8"))
+
+
+# Adds the rows of a part to the totals of their group and day
+def add_part(aggregate, part_columns):
+    rows = zip(part_columns["date"], part_columns["mode"], part_columns["fuel"], part_columns["department"],
+               part_columns["scope1_t"], part_columns["scope2_t"], part_columns["scope3_t"])
+    for date, mode, fuel, department, scope1, scope2, scope3 in rows:
+        group = "|".join([mode, fuel, department])
+        for totals in (aggregate["total"], aggregate["days"].setdefault(date, {})):
+            values = totals.setdefault(group, [0, 0.0, 0.0, 0.0])
+            values[0] += 1
+            values[1] += scope1
+            values[2] += scope2
+            values[3] += scope3
+    aggregate["parts"] += 1
+
+
+# Days of the month up to today
+def days_of_month(month, now):
+    year, month_number = int(month[:4]), int(month[5:7])
+    today = datetime.fromtimestamp(now, timezone.utc).strftime("%Y-%m-%d")
+    days = ["%s-%02d" % (month, day) for day in range(1, calendar.monthrange(year, month_number)[1] + 1)]
+    return [day for day in days if day <= today]
+
+
+# Adds the new parts of the month, returns the number of added parts
+def roll_up_month(month, now, aggregate=None):
+    if aggregate is None:
+        aggregate = read_month(month)
+    cutoff = int((now - settle_seconds) * 1000)
+    if cutoff <= aggregate["watermark"]:
+        return 0
+    added = 0
+    for mode in emission_store.modes:
+        for day in days_of_month(month, now):
+            partition = "mode=%s/date=%s/" % (mode, day)
+            # The names of the parts start with the time they were written
+            for key in emission_store.list_keys(partition, partition + "part-%013d" % (aggregate["watermark"] + 1)):
+                written_at = int(key[len(partition) + len("part-"):][:13])
+                if written_at > cutoff:
+                    break
+                add_part(aggregate, emission_store.read_part(key, emission_store.read_object(key)))
+                added += 1
+    aggregate["watermark"] = cutoff
+    write_month(aggregate)
+    return added
+
+
+def month_of(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m")
+
+
+# Rolls up the current month and, on the first day of a month, the month before,
+# whose last parts can still arrive after its end. Returns month -> number of added parts.
+def run(now=None):
+    now = time.time() if now is None else now
+    months = sorted({month_of(now - settle_seconds - late_part_seconds), month_of(now)})
+    return {month: roll_up_month(month, now) for month in months}
+
+
+# Calculates the month again from all its parts, e.g. after parts were deleted
+def rebuild(month, now=None):
+    now = time.time() if now is None else now
+    return roll_up_month(month, now, new_month(month))
+
+
+# Sums up the groups of the month (or of one day of it) by the given dimensions.
+# mode, fuel and department filter the groups.
+def query(month, group_by=("department",), mode=None, fuel=None, department=None, day=None):
+    aggregate = read_month(month)
+    groups = aggregate["days"].get(day, {}) if day is not None else aggregate["total"]
+    filters = {"mode": mode, "fuel": fuel, "department": department}
+    sums = {}
+    for group, values in groups.items():
+        # The department is the last part, it may contain a "|"
+        fields = dict(zip(dimensions, group.split("|", 2)))
+        if any(value is not None and fields[name] != value for name, value in filters.items()):
+            continue
+        key = tuple(fields[name] for name in group_by)
+        totals = sums.setdefault(key, [0, 0.0, 0.0, 0.0])
+        for index, value in enumerate(values):
+            totals[index] += value
+    return [dict(zip(group_by, key), **dict(zip(metrics, totals))) for key, totals in sorted(sums.items())]
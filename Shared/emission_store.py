@@ -0,0 +1,280 @@
+import contextvars
+import functools
+import gzip
+import inspect
+import io
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import async_aws
+import aws_clients
+import factor_repository
+import instrumentation
+
+#-------------------------------------------------------------------------------
+# Columnar store of the calculated trips.
+# recorded_handler wraps a lambda_handler and appends one row per successful
+# trip (every trip of a batch) to a buffer of the container. The buffer is
+# written as one part file per mode and day, partitioned like
+#   <prefix>/mode=car/date=2026-10-18/part-1760781234567-1a2b3c4d.parquet
+# Parquet is written if pyarrow is part of the deployment, otherwise the
+# columns are written as gzipped JSON (.json.gz). read_part reads both.
+# The prefix is a local directory or s3://bucket/prefix (EMISSION_STORE_PREFIX),
+# without a prefix nothing is recorded. The buffer is written at the end of an
+# invocation, before the reply, when it has flush_rows rows or its oldest row
+# is flush_seconds old. By default every invocation writes its rows: Lambda
+# freezes a container between invocations and may shut it down at any time, so
+# rows which are left in the buffer (or a write which is left running) may
+# never reach the store. Larger values (EMISSION_STORE_FLUSH_ROWS,
+# EMISSION_STORE_FLUSH_SECONDS) write fewer parts but lose these rows.
+# The number in the name of a part is the time (ms) it was written. The write
+# ends within the invocation, so within the timeout of the function, and
+# emission_rollup adds the parts in this order once they are older than that.
+# A failed write never fails the request, the rows are written with the next flush.
+# Columns: date, recorded_at, mode, fuel, department, scope1_t, scope2_t, scope3_t
+#   scope1: direct emissions (tank to wheel, flight), scope2: electricity,
+#   scope3: well to tank, all in t CO2e. department is the field "department"
+#   of the event (or of the trip of a batch).
+#   A row holds the emissions of the travellers of a trip: the whole car, the
+#   passengers of a flight, one passenger of a bus.
+# Example:
+#   @instrumentation.traced_handler("car")
+#   @emission_store.recorded_handler("car")
+#   @result_cache.cached_handler("car")
+#   def lambda_handler(event, context):
+#-------------------------------------------------------------------------------
+
+columns = ["date", "recorded_at", "mode", "fuel", "department", "scope1_t", "scope2_t", "scope3_t"]
+prefix = os.environ.get("EMISSION_STORE_PREFIX", "")
+flush_rows = int(os.environ.get("EMISSION_STORE_FLUSH_ROWS", "1"))
+flush_seconds = float(os.environ.get("EMISSION_STORE_FLUSH_SECONDS", "0"))
+# Rows which could not be written are kept up to this number
+max_buffer_rows = 100000
+default_department = "unknown"
+
+buffer = []
+buffer_lock = threading.Lock()
+# Handlers called by a recorded handler do not record the trip again
+inside_recorded_handler = contextvars.ContextVar("inside_recorded_handler", default=False)
+
+
+def number(value):
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else 0.0
+
+
+# (fuel, scope1, scope2, scope3) of the reply of a car trip
+def car_emissions(trip, reply):
+    body = reply['body']
+    scope1 = body['scope1']['CO2_äquivalent'] if "scope1" in body else body['CO2_äquivalent']
+    scope3 = number(body['scope3']['WTT']) if "scope3" in body else 0.0
+    electricity = body.get('electricity')
+    scope2 = number(electricity.get('directCO2med')) if isinstance(electricity, dict) else 0.0
+    return trip.get("fuel"), number(scope1), scope2, scope3
+
+
+# Diesel buses in kg CO2 per passenger. Electric buses with the electricity mix
+# in t for the whole bus, they are shared by the average occupancy of a bus, so
+# both fuels are recorded per passenger.
+def bus_emissions(trip, reply):
+    body = reply['body']
+    if reply['input']['Fuel'] == "electricity":
+        occupancy = float(factor_repository.get_factor("BusEmissionFactors", "electricity")["occupancy"])
+        return "electricity", 0.0, number(body['directCO2med']) / occupancy, 0.0
+    return reply['input']['Fuel'], number(body['Co2EmissionFinal']) / 1000, 0.0, 0.0
+
+
+# Flight and LTO emissions in kg CO2
+def flight_emissions(trip, reply):
+    scope1 = number(reply['Flight_Emission']['Co2_kg']) + number(reply['LTO_Emission']['Co2_kg'])
+    return "kerosene", scope1 / 1000, 0.0, 0.0
+
+
+# mode -> (emissions of one reply, field of the trips of a batch event and reply)
+modes = {
+    "car": (car_emissions, None),
+    "bus": (bus_emissions, "trips"),
+    "flight": (flight_emissions, "legs"),
+}
+
+
+# Returns the rows of the successful trips of the event
+def get_rows(mode, event, reply):
+    emissions, batch_field = modes[mode]
+    if not isinstance(reply, dict) or reply.get('statusCode') != 200:
+        return []
+    if batch_field is not None and batch_field in event:
+        trips = zip(event[batch_field], reply.get(batch_field, []))
+    else:
+        trips = [(event, reply)]
+
+    now = datetime.now(timezone.utc)
+    rows = []
+    for trip, trip_reply in trips:
+        if not isinstance(trip_reply, dict) or trip_reply.get('statusCode') != 200:
+            continue
+        try:
+            fuel, scope1, scope2, scope3 = emissions(trip, trip_reply)
+        except (KeyError, TypeError, AttributeError) as error:
+            print("Trip could not be recorded: " + repr(error))
+            continue
+        department = trip.get("department", event.get("department")) or default_department
+        rows.append([now.strftime("%Y-%m-%d"), now.timestamp(), mode, str(fuel), str(department),
+                     scope1, scope2, scope3])
+    return rows
+
+
+# Buffers the rows and writes them if the buffer is full or old enough
+def record(rows):
+    with buffer_lock:
+        buffer.extend(rows)
+        if len(buffer) > max_buffer_rows:
+            print("Emission store buffer is full, dropped rows: " + str(len(buffer) - max_buffer_rows))
+            del buffer[:len(buffer) - max_buffer_rows]
+        due = bool(buffer) and (len(buffer) >= flush_rows or time.time() - buffer[0][1] >= flush_seconds)
+    if due:
+        flush()
+
+
+# Writes all buffered rows, one part per mode and date
+def flush():
+    with buffer_lock:
+        rows = list(buffer)
+        buffer.clear()
+    if not rows:
+        return
+    partitions = {}
+    for row in rows:
+        partitions.setdefault((row[2], row[0]), []).append(row)
+    failed = []
+    for (mode, date), partition_rows in partitions.items():
+        try:
+            write_part(mode, date, partition_rows)
+        except Exception as error:
+            print("Emission store could not be written: " + str(error))
+            failed.extend(partition_rows)
+    if failed:
+        with buffer_lock:
+            buffer[:0] = failed
+
+
+def write_part(mode, date, rows):
+    data = {name: [row[index] for row in rows] for index, name in enumerate(columns)}
+    body, extension = encode_part(data)
+    name = "part-%013d-%s%s" % (int(time.time() * 1000), uuid.uuid4().hex[:8], extension)
+    key = "mode=%s/date=%s/%s" % (mode, date, name)
+    with instrumentation.span("emission_store", "write") as details:
+        if details is not None:
+            details["request_bytes"] = len(body)
+        write_object(key, body)
+
+
+# Parquet if pyarrow is deployed, otherwise gzipped JSON of the columns
+def encode_part(data):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        return gzip.compress(json.dumps({"columns": data}).encode("utf-8")), ".json.gz"
+    output = io.BytesIO()
+    pyarrow.parquet.write_table(pyarrow.table(data), output, compression="snappy")
+    return output.getvalue(), ".parquet"
+
+
+# Returns the columns of a part: name -> list of values
+def read_part(key, body):
+    if key.endswith(".json.gz"):
+        return json.loads(gzip.decompress(body).decode("utf-8"))["columns"]
+    import pyarrow
+    import pyarrow.parquet
+    return pyarrow.parquet.read_table(pyarrow.BufferReader(body)).to_pydict()
+
+
+# Storage of the prefix: a local directory or an S3 prefix. Keys are relative to the prefix.
+def split_s3_prefix():
+    bucket_name, _, key_prefix = prefix[len("s3://"):].partition("/")
+    return bucket_name, key_prefix.strip("/") + "/" if key_prefix.strip("/") else ""
+
+
+def write_object(key, body):
+    if prefix.startswith("s3://"):
+        bucket_name, key_prefix = split_s3_prefix()
+        aws_clients.bucket(bucket_name).Object(key_prefix + key).put(Body=body)
+        return
+    path = os.path.join(prefix, *key.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written under another name first, so no reader sees half a file
+    with open(path + ".tmp", "wb") as part_file:
+        part_file.write(body)
+    os.replace(path + ".tmp", path)
+
+
+# Returns the content of the object, None if it does not exist
+def read_object(key):
+    if prefix.startswith("s3://"):
+        bucket_name, key_prefix = split_s3_prefix()
+        try:
+            with instrumentation.span("s3", "get"):
+                return aws_clients.bucket(bucket_name).Object(key_prefix + key).get()["Body"].read()
+        except Exception as error:
+            if aws_clients.get_error_code(error) in ("NoSuchKey", "404"):
+                return None
+            raise
+    try:
+        with open(os.path.join(prefix, *key.split("/")), "rb") as part_file:
+            return part_file.read()
+    except FileNotFoundError:
+        return None
+
+
+# Returns the sorted keys of the objects in the directory key_prefix (e.g. a
+# partition) which come after the key start_after
+def list_keys(key_prefix, start_after=""):
+    if prefix.startswith("s3://"):
+        bucket_name, s3_prefix = split_s3_prefix()
+        with instrumentation.span("s3", "list"):
+            items = aws_clients.bucket(bucket_name).objects.filter(Prefix=s3_prefix + key_prefix,
+                                                                   Marker=s3_prefix + start_after)
+            return sorted(item.key[len(s3_prefix):] for item in items)
+    directory = os.path.join(prefix, *key_prefix.strip("/").split("/"))
+    if not os.path.isdir(directory):
+        return []
+    keys = [key_prefix.rstrip("/") + "/" + name for name in os.listdir(directory) if not name.endswith(".tmp")]
+    return sorted(key for key in keys if key > start_after)
+
+
+# Also wraps the async handlers (see async_aws)
+def recorded_handler(mode):
+    def decorator(handler):
+        if inspect.iscoroutinefunction(handler):
+            @functools.wraps(handler)
+            async def async_wrapper(event, context):
+                if not prefix or inside_recorded_handler.get():
+                    return await handler(event, context)
+                token = inside_recorded_handler.set(True)
+                try:
+                    reply = await handler(event, context)
+                finally:
+                    inside_recorded_handler.reset(token)
+                rows = get_rows(mode, event, reply)
+                if rows:
+                    await async_aws.run(record, rows)
+                return reply
+            return async_wrapper
+
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            if not prefix or inside_recorded_handler.get():
+                return handler(event, context)
+            token = inside_recorded_handler.set(True)
+            try:
+                reply = handler(event, context)
+            finally:
+                inside_recorded_handler.reset(token)
+            record(get_rows(mode, event, reply))
+            return reply
+        return wrapper
+    return decorator
@@ -0,0 +1,224 @@
+import json
+import os
+import random
+import time
+
+import aws_clients
+import factor_snapshot
+import factor_version
+import instrumentation
+
+#-------------------------------------------------------------------------------
+# One place to read emission factors from.
+# A request asks for all the factors it needs at once (get_factors), the ones
+# which are not in memory yet are read with one batch_get_item. Every factor is
+# kept in memory for factor_max_age_seconds, so warm containers read DynamoDB
+# only after that time again. Factors which are not in the table are remembered
+# as None, so they are not requested again and again.
+# On a cold start the factors come from a local snapshot instead of DynamoDB:
+# the binary snapshot factor_snapshot.bin (see factor_snapshot) is memory-mapped
+# at import, a JSON snapshot (load_snapshot) is read completely. Snapshot
+# factors are used for factor_max_age_seconds after the start of the container.
+# FACTOR_SNAPSHOT_PATH overrides the default path next to this module.
+# Changed factors are dropped as soon as the factor_version is bumped (see
+# FactorStream), so the time in memory is only a fallback. A snapshot which was
+# built at an older factor_version is dropped with the first version check of
+# the container (drop_outdated_snapshot).
+# Example: get_factors([("EmissionFactorsFuel_WTT", "Diesel"), ("AircraftCapacity", "A380")])
+#-------------------------------------------------------------------------------
+
+# Tables and the name of their key
+tables = {
+    "EmissionFactorsAfterDIN16258": "fuel_type",
+    "EmissionFactorsFuel_WTT": "fuel_type",
+    "AircraftCapacity": "Aircraft",
+    "BusEmissionFactors": "fuel",
+}
+
+# Factors which are not stored in DynamoDB, they can be overwritten by a snapshot
+local_factors = {
+    "BusEmissionFactors": {
+        # All values in grams per person-kilometer
+        "diesel": {"fuel": "diesel", "Co2": 33, "NOx": 0.21, "PM": 0.0044},
+        # Consumption of the whole bus in kwh/km. occupancy is the average number
+        # of passengers, about the occupancy the diesel factor per person-kilometer
+        # is based on, it shares the emissions of an electric bus per passenger.
+        "electricity": {"fuel": "electricity", "consumption": 1.296, "occupancy": 22},
+    },
+}
+
+# Same intervall as the fuel files of the database_helper
+factor_max_age_seconds = 60 * 60
+
+# DynamoDB accepts at most 100 keys per batch_get_item call
+batch_get_item_limit = 100
+# Unprocessed keys (throttling) are requested again at most this often, after
+# an exponentially growing pause with full jitter (base * 2^attempt, at most max)
+max_batch_attempts = 6
+retry_base_seconds = 0.05
+retry_max_seconds = 1.0
+
+# (table, key) -> (loaded at, item or None)
+factors = {}
+# Version of the loaded snapshot, None if no snapshot was loaded
+snapshot_version = None
+# factor_version the snapshot was built at, None if it is not stamped
+snapshot_factor_version = None
+# If the snapshot was already compared with the factor_version marker
+snapshot_checked = False
+# The memory-mapped binary snapshot and when it was loaded
+binary_snapshot = None
+snapshot_loaded_at = 0
+
+
+# Returns the factor of one key, None if it does not exist
+def get_factor(table_name, key):
+    return get_factors([(table_name, key)])[(table_name, key)]
+
+
+# Returns a dict (table, key) -> item (None if it does not exist) for all keys
+def get_factors(keys):
+    drop_outdated_snapshot(factor_version.check())
+    now = time.time()
+    result = {}
+    missing = []
+    for table_key in keys:
+        table_name, key = table_key
+        if table_name in local_factors:
+            item = get_from_snapshot(table_name, key)
+            result[table_key] = item if item is not None else local_factors[table_name].get(key)
+            continue
+        entry = factors.get(table_key)
+        if entry is not None and now - entry[0] < factor_max_age_seconds:
+            instrumentation.record_cache("factor", "hit")
+            result[table_key] = entry[1]
+            continue
+        # Cold start: the item is read from the memory-mapped snapshot
+        item = None
+        if entry is None and now - snapshot_loaded_at < factor_max_age_seconds:
+            item = get_from_snapshot(table_name, key)
+        if item is not None:
+            instrumentation.record_cache("factor", "snapshot")
+            factors[table_key] = (snapshot_loaded_at, item)
+            result[table_key] = item
+        elif table_key not in missing:
+            instrumentation.record_cache("factor", "miss")
+            missing.append(table_key)
+
+    if missing:
+        items = read_from_database(missing)
+        for table_key in missing:
+            item = items.get(table_key)
+            factors[table_key] = (now, item)
+            result[table_key] = item
+    return result
+
+
+# Drops the changed factors, called by factor_version. They are read from the
+# database with their next use, not from the snapshot, which is older.
+# changes is None if it is not known what changed.
+def invalidate_factors(changes):
+    global snapshot_loaded_at
+    if changes is None:
+        snapshot_loaded_at = 0
+        for table_key in list(factors):
+            factors[table_key] = (0, None)
+        return
+    for table_name, keys in changes.items():
+        for key in keys:
+            factors[(table_name, key)] = (0, None)
+
+
+factor_version.add_listener(invalidate_factors)
+
+
+# The listeners of factor_version only see the versions after the first check
+# of the container. A snapshot built before the current version, or without a
+# version, could contain changed factors, so it is dropped completely.
+def drop_outdated_snapshot(current_version):
+    global snapshot_checked
+    if snapshot_checked or current_version is None:
+        return
+    snapshot_checked = True
+    if snapshot_version is None or current_version == 0:
+        return
+    if snapshot_factor_version is None or current_version > snapshot_factor_version:
+        print("Factor snapshot dropped, factor version: " + str(snapshot_factor_version) + " < " + str(current_version))
+        invalidate_factors(None)
+
+
+# Reads all keys with as few batch_get_item calls as possible
+def read_from_database(keys):
+    dynamodb = aws_clients.resource('dynamodb')
+    items = {}
+    for start in range(0, len(keys), batch_get_item_limit):
+        request_items = {}
+        for table_name, key in keys[start:start + batch_get_item_limit]:
+            request_items.setdefault(table_name, {'Keys': []})['Keys'].append({tables[table_name]: key})
+
+        # Keys which DynamoDB could not process (throttling) are requested again
+        for attempt in range(max_batch_attempts):
+            if attempt > 0:
+                time.sleep(random.uniform(0, min(retry_max_seconds, retry_base_seconds * 2 ** attempt)))
+            with instrumentation.span("dynamodb", "batch_get_item"):
+                response = dynamodb.batch_get_item(RequestItems=request_items)
+            for table_name, table_items in response['Responses'].items():
+                for item in table_items:
+                    items[(table_name, item[tables[table_name]])] = item
+            request_items = response.get('UnprocessedKeys')
+            if not request_items:
+                break
+        else:
+            # The keys are not remembered as missing, the request fails like a throttled call
+            raise RuntimeError("The factors could not be read after " + str(max_batch_attempts) + " attempts")
+    return items
+
+
+# Returns the item from the binary snapshot, None if there is none
+def get_from_snapshot(table_name, key):
+    if binary_snapshot is None:
+        return None
+    return factor_snapshot.get_item(binary_snapshot, table_name, key)
+
+
+# Memory-maps a binary snapshot, its items are decoded when they are requested
+def load_binary_snapshot(path):
+    global binary_snapshot, snapshot_loaded_at, snapshot_version, snapshot_factor_version
+    binary_snapshot = factor_snapshot.open_snapshot(path)
+    snapshot_loaded_at = time.time()
+    snapshot_version = binary_snapshot["version"]
+    snapshot_factor_version = binary_snapshot["factor_version"]
+    print("Binary factor snapshot mapped, version: " + str(snapshot_version))
+
+
+# Fills the repository from a JSON snapshot file:
+# {"version": "...", "factor_version": 12, "tables": {"table name": [items]}}
+def load_snapshot(path):
+    global snapshot_version, snapshot_factor_version
+    with open(path) as snapshot_file:
+        snapshot = json.load(snapshot_file)
+
+    now = time.time()
+    for table_name, items in snapshot["tables"].items():
+        if table_name in local_factors:
+            local_factors[table_name].update({item[tables[table_name]]: item for item in items})
+            continue
+        for item in items:
+            factors[(table_name, item[tables[table_name]])] = (now, item)
+    snapshot_version = snapshot.get("version")
+    snapshot_factor_version = snapshot.get("factor_version")
+    print("Factor snapshot loaded, version: " + str(snapshot_version))
+
+
+module_directory = os.path.dirname(os.path.abspath(__file__))
+snapshot_paths = [os.path.join(module_directory, "factor_snapshot.bin"),
+                  os.path.join(module_directory, "factor_snapshot.json")]
+if "FACTOR_SNAPSHOT_PATH" in os.environ:
+    snapshot_paths = [os.environ["FACTOR_SNAPSHOT_PATH"]]
+for snapshot_path in snapshot_paths:
+    if os.path.exists(snapshot_path):
+        if snapshot_path.endswith(".json"):
+            load_snapshot(snapshot_path)
+        else:
+            load_binary_snapshot(snapshot_path)
+        break
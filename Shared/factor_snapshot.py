@@ -0,0 +1,136 @@
+import json
+import math
+import mmap
+import struct
+from array import array
+
+#-------------------------------------------------------------------------------
+# Compact binary snapshot of the emission factor tables.
+# The snapshot is built before deploying (Tools/build_factor_snapshot.py) and
+# shipped with the layer. At import it is memory-mapped, only the small header
+# and the keys are decoded, the values stay in the file until they are read.
+#
+# Layout of the file (little-endian):
+#   b"EFS1", header length (uint32), header (JSON), then per table:
+#   key offsets (uint32, rows + 1), keys (utf-8),
+#   one float64 column per numeric attribute (NaN if the item has no value),
+#   extra offsets (uint32, rows + 1), other attributes per item (JSON)
+# Every block starts at a multiple of 8 bytes.
+#-------------------------------------------------------------------------------
+
+magic = b"EFS1"
+
+
+# Returns the length of the padding up to the next multiple of 8
+def padding(length):
+    return (8 - length % 8) % 8
+
+
+# DynamoDB returns numbers as Decimal
+def is_number(value):
+    if isinstance(value, bool):
+        return False
+    return isinstance(value, (int, float)) or type(value).__name__ == "Decimal"
+
+
+# Writes the snapshot. tables: {"table name": {"key": key attribute, "items": [items]}}
+# factor_version is the version of the factor_version marker the items were read
+# at, None if it is not known
+def write_snapshot(path, version, tables, factor_version=None):
+    blocks = []
+    offset = 0
+    header = {"version": version, "factor_version": factor_version, "tables": {}}
+
+    def add_block(data):
+        nonlocal offset
+        block_offset = offset
+        data = bytes(data)
+        blocks.append(data + b"\0" * padding(len(data)))
+        offset += len(blocks[-1])
+        return block_offset
+
+    for table_name, table in tables.items():
+        key_name = table["key"]
+        items = table["items"]
+        columns = sorted({name for item in items for name, value in item.items()
+                          if name != key_name and is_number(value)})
+
+        keys = [str(item[key_name]).encode("utf-8") for item in items]
+        key_offsets = array("I", [0])
+        for key in keys:
+            key_offsets.append(key_offsets[-1] + len(key))
+
+        extras = []
+        for item in items:
+            other = {name: value for name, value in item.items()
+                     if name != key_name and name not in columns}
+            extras.append(json.dumps(other, default=str).encode("utf-8") if other else b"")
+        extra_offsets = array("I", [0])
+        for extra in extras:
+            extra_offsets.append(extra_offsets[-1] + len(extra))
+
+        header["tables"][table_name] = {
+            "key": key_name,
+            "rows": len(items),
+            "key_offsets": add_block(key_offsets.tobytes()),
+            "keys": add_block(b"".join(keys)),
+            "columns": {name: add_block(array("d", [float(item[name]) if name in item else math.nan
+                                                     for item in items]).tobytes())
+                        for name in columns},
+            "extra_offsets": add_block(extra_offsets.tobytes()),
+            "extras": add_block(b"".join(extras)),
+        }
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_bytes += b" " * padding(len(magic) + 4 + len(header_bytes))
+    with open(path, "wb") as snapshot_file:
+        snapshot_file.write(magic + struct.pack("<I", len(header_bytes)) + header_bytes)
+        for block in blocks:
+            snapshot_file.write(block)
+
+
+# Memory-maps a snapshot, returns a dict with its versions and the tables
+def open_snapshot(path):
+    with open(path, "rb") as snapshot_file:
+        data = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+    if data[:4] != magic:
+        raise ValueError(path + " is not a factor snapshot")
+    header_length = struct.unpack_from("<I", data, 4)[0]
+    header = json.loads(data[8:8 + header_length].decode("utf-8"))
+    body = memoryview(data)[8 + header_length:]
+
+    snapshot = {"version": header["version"], "factor_version": header.get("factor_version"), "tables": {}}
+    for table_name, table in header["tables"].items():
+        rows = table["rows"]
+        key_offsets = body[table["key_offsets"]:table["key_offsets"] + 4 * (rows + 1)].cast("I")
+        keys = bytes(body[table["keys"]:table["keys"] + key_offsets[rows]])
+        snapshot["tables"][table_name] = {
+            "key": table["key"],
+            # key -> row, so every item is found directly
+            "index": {keys[key_offsets[row]:key_offsets[row + 1]].decode("utf-8"): row for row in range(rows)},
+            "columns": {name: body[column:column + 8 * rows].cast("d")
+                        for name, column in table["columns"].items()},
+            "extra_offsets": body[table["extra_offsets"]:table["extra_offsets"] + 4 * (rows + 1)].cast("I"),
+            "extras": body[table["extras"]:],
+        }
+    return snapshot
+
+
+# Returns the item of the key from the snapshot, None if it is not in there
+def get_item(snapshot, table_name, key):
+    table = snapshot["tables"].get(table_name)
+    if table is None:
+        return None
+    row = table["index"].get(str(key))
+    if row is None:
+        return None
+
+    item = {table["key"]: key}
+    for name, column in table["columns"].items():
+        if not math.isnan(column[row]):
+            item[name] = column[row]
+    start = table["extra_offsets"][row]
+    end = table["extra_offsets"][row + 1]
+    if end > start:
+        item.update(json.loads(bytes(table["extras"][start:end]).decode("utf-8")))
+    return item
@@ -0,0 +1,112 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import aws_clients
+import instrumentation
+
+#-------------------------------------------------------------------------------
+# Version marker of the emission factors.
+# The FactorStream function bumps the version whenever an item of the factor
+# tables changes (bump_version). It writes the version together with the changed
+# keys into a small S3 object. Warm containers read the marker at most every
+# check_interval_seconds (check) and tell the caches which registered a
+# listener what changed, so the caches can keep their factors for a long time
+# and still see an edit within seconds.
+# FACTOR_VERSION_BUCKET and FACTOR_VERSION_CHECK_SECONDS override the defaults.
+# Example: factor_version.add_listener(lambda changes: ...)
+#          changes: {"EmissionFactorsAfterDIN16258": ["Diesel"]}, None if unknown
+#-------------------------------------------------------------------------------
+
+bucket_name = os.environ.get("FACTOR_VERSION_BUCKET", "emissionfactorsbucket")
+marker_key = "factor_version.json"
+check_interval_seconds = float(os.environ.get("FACTOR_VERSION_CHECK_SECONDS", "10"))
+
+# How often bump_version tries again if another stream batch wrote the marker first
+max_bump_attempts = 5
+# Error codes of S3, if a conditional write was rejected
+precondition_error_codes = ("PreconditionFailed", "ConditionalRequestConflict")
+
+# Version the caches of this container are at, None before the first check
+version = None
+checked_at = 0
+listeners = []
+lock = threading.Lock()
+
+
+def get_bucket():
+    return aws_clients.bucket(bucket_name)
+
+
+# The listener is called with the changes of a new version
+def add_listener(listener):
+    listeners.append(listener)
+
+
+# Returns the marker, None if there is none yet
+def read_marker():
+    try:
+        with instrumentation.span("s3", "get"):
+            response = get_bucket().Object(key=marker_key).get()
+            return json.load(response["Body"]), response.get("ETag")
+    except Exception as error:
+        if aws_clients.get_error_code(error) in ("NoSuchKey", "404"):
+            return None, None
+        raise
+
+
+# Reads the marker if the last check is older than check_interval_seconds and
+# informs the listeners about a new version. Returns the known version.
+def check():
+    global version, checked_at
+    now = time.time()
+    with lock:
+        if now - checked_at < check_interval_seconds:
+            return version
+        checked_at = now
+
+    try:
+        marker, etag = read_marker()
+    except Exception as error:
+        # The caches keep their factors until their own time is over
+        print("Factor version could not be read: " + str(error))
+        return version
+    if marker is None:
+        # No change was pushed yet
+        marker = {"version": 0, "changes": {}}
+    if marker["version"] == version:
+        return version
+
+    # Only the changes of the last version are in the marker, if more versions
+    # were missed everything is invalidated
+    if version is not None:
+        changes = marker.get("changes") if marker["version"] == version + 1 else None
+        instrumentation.record_cache("factor_version", "changed")
+        for listener in listeners:
+            listener(changes)
+    version = marker["version"]
+    return version
+
+
+# Writes the next version with the changed keys: table -> list of keys.
+# The marker is written conditionally, so two stream batches cannot lose a version.
+def bump_version(changes):
+    marker_object = get_bucket().Object(key=marker_key)
+    for attempt in range(max_bump_attempts):
+        marker, etag = read_marker()
+        new_marker = {
+            "version": (marker["version"] if marker is not None else 0) + 1,
+            "changes": changes,
+            "updated_at": str(datetime.now())
+        }
+        condition = {"IfMatch": etag} if marker is not None else {"IfNoneMatch": "*"}
+        try:
+            with instrumentation.span("s3", "put"):
+                marker_object.put(Body=json.dumps(new_marker), ContentType="application/json", **condition)
+            return new_marker["version"]
+        except Exception as error:
+            if aws_clients.get_error_code(error) not in precondition_error_codes:
+                raise
+    raise RuntimeError("The factor version could not be written after " + str(max_bump_attempts) + " attempts")
@@ -0,0 +1,50 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+
+#-------------------------------------------------------------------------------
+# Runs the independent lookups of one request (invokes, DynamoDB and S3 reads)
+# at the same time instead of one after another.
+# The thread pool is created once per container and reused by all warm
+# invocations. Every fan out has a time budget, lookups which are not done in
+# time are reported as error together with all lookups which failed, so one
+# slow dependency cannot hold the whole request.
+#-------------------------------------------------------------------------------
+
+max_workers = 8
+executor = ThreadPoolExecutor(max_workers=max_workers)
+
+#Time budget if there is no Lambda context (e.g. local tests)
+default_timeout_seconds = 2.5
+#Time which is kept free to build the reply before Lambda stops the invocation
+reply_reserve_ms = 300
+
+
+#Returns the time budget in seconds for the lookups of this invocation
+def get_timeout(context):
+    if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+        return default_timeout_seconds
+    return max(context.get_remaining_time_in_millis() - reply_reserve_ms, 0) / 1000
+
+
+#Runs all lookups concurrently, lookups is a dict: name -> (function, arguments...)
+#Returns a dict name -> result and a dict name -> error message
+def fan_out(lookups, timeout):
+    futures = {}
+    for name, (function, *arguments) in lookups.items():
+        # Every lookup runs in a copy of the context, so it is traced as part
+        # of the invocation which started it (see instrumentation)
+        futures[name] = executor.submit(contextvars.copy_context().run, function, *arguments)
+
+    done, not_done = wait(futures.values(), timeout=timeout)
+
+    results = {}
+    errors = {}
+    for name, future in futures.items():
+        if future in not_done:
+            future.cancel()
+            errors[name] = "no reply within %.1f seconds" % timeout
+        elif future.exception() is not None:
+            errors[name] = type(future.exception()).__name__ + ": " + str(future.exception())
+        else:
+            results[name] = future.result()
+    return results, errors
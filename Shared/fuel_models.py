@@ -0,0 +1,96 @@
+#-------------------------------------------------------------------------------
+# Registry of the fuel types of a car.
+# Every fuel is described by data instead of an if-branch: the keys of its
+# consumption in the reply of getCarFuelConsumptionAverage, the attribute of its
+# well to tank factor, its CO2 factor and the ratios of its greenhouse gases.
+# A fuel is resolved once per container (resolve_model), the factors of the
+# database are turned into coefficients once per version of the factors
+# (get_coefficients), so a request only multiplies its amount of fuel with them.
+# A new fuel is added by adding an entry to fuel_models.
+# Example: get_coefficients(resolve_model("Diesel"), item, itemWTT) -> scope1, scope3
+#-------------------------------------------------------------------------------
+
+# Attribute of the tank to wheel factor in EmissionFactorsAfterDIN16258 (kgCO2e per unit)
+ttw_attribute = "THG_emissionfactor_TTW_kgCo2e/l"
+
+# Greenhouse gases which are calculated from the CO2 emission
+greenhouse_gases = ["CO", "NOx", "HC"]
+
+# consumption: prefix of the City/Highway/Comb values of getCarFuelConsumptionAverage
+# wtt_attribute: attribute in EmissionFactorsFuel_WTT, None if there is no WTT emission
+# co2_kg_per_unit: CO2 of one unit of fuel, only fuels with greenhouse gases have it
+# greenhouse_gas_ratios: divisor of the CO2 and the ratios of CO, NOx and HC
+# electricity_mix: the emissions of the consumed kwh come from the electricity
+#                  mix of the departure country (electricity_factors)
+# speed_curve: consumption curve over the speed of a route segment (segment_engine),
+#              "combustion" if it is not given
+fuel_models = {
+    'Diesel': {
+        'consumption': "fuelInLPer100Km",
+        'wtt_attribute': "THG_emissionfactor_WTT_kgCo2e/l",
+        'co2_kg_per_unit': 2.64,
+        # Scope1-TankToWheel-Diesel
+        'greenhouse_gas_ratios': (12, [0.8, 0.12, 0.08]),
+    },
+    'Petrol': {
+        'consumption': "fuelInLPer100Km",
+        'wtt_attribute': "THG_emissionfactor_WTT_kgCo2e/l",
+        'co2_kg_per_unit': 2.33,
+        # Scope1-TankToWheel-Benzin
+        'greenhouse_gas_ratios': (8 * 5, [0.2, 0.55, 0.1]),
+    },
+    'Biodiesel': {'consumption': "fuelInLPer100Km", 'wtt_attribute': "THG_emissionfactor_WTT_kgCo2e/l"},
+    'Ethanol': {'consumption': "fuelInLPer100Km", 'wtt_attribute': "THG_emissionfactor_WTT_kgCo2e/l"},
+    'LPG': {'consumption': "fuelInLPer100Km", 'wtt_attribute': "THG_emissionfactor_WTT_kgCo2e/kg"},
+    'CNG': {'consumption': "fuelInLPer100Km", 'wtt_attribute': "THG_emissionfactor_WTT_kgCo2e/kg"},
+    'LNG': {'consumption': "fuelInLPer100Km", 'wtt_attribute': "THG_emissionfactor_WTT_kgCo2e/kg"},
+    # still to do: well to tank emissions of electricity
+    'Electricity': {'consumption': "electricityInKWHPer100Km", 'wtt_attribute': None, 'electricity_mix': True,
+                    'speed_curve': "electric"},
+}
+
+# Fuels which are in the database but not in the registry only get their CO2 equivalent
+default_model = {'consumption': "fuelInLPer100Km", 'wtt_attribute': None}
+
+# fuel -> resolved model, filled once per container
+resolved_models = {}
+# (fuel, ttw factor, wtt factor) -> coefficients
+coefficients = {}
+
+
+# Returns the model of the fuel with its CO2 factor in tons per unit and the
+# coefficient of every greenhouse gas per ton of CO2
+def resolve_model(fuel):
+    model = resolved_models.get(fuel)
+    if model is None:
+        model = dict(fuel_models.get(fuel, default_model), fuel=fuel)
+        if model.get('greenhouse_gas_ratios') is not None:
+            divisor, ratios = model['greenhouse_gas_ratios']
+            co2_t_per_unit = model['co2_kg_per_unit'] / 1000
+            model['greenhouse_gas_coefficients'] = [co2_t_per_unit / divisor * ratio for ratio in ratios]
+        resolved_models[fuel] = model
+    return model
+
+
+# Turns the factors of the database into the coefficients of the model, all in
+# tons per unit of fuel:
+# scope1: [CO2 equivalent (TTW), CO, NOx, HC], the gases only for fuels with ratios
+# scope3: WTT, None if the fuel has no WTT emission
+def get_coefficients(model, item, itemWTT):
+    wtt_attribute = model['wtt_attribute']
+    ttw = item[ttw_attribute]
+    wtt = itemWTT.get(wtt_attribute) if wtt_attribute is not None else None
+    key = (model['fuel'], ttw, wtt)
+    result = coefficients.get(key)
+    if result is None:
+        scope1 = [float(ttw) / 1000] + model.get('greenhouse_gas_coefficients', [])
+        scope3 = float(wtt) / 1000 if wtt is not None else None
+        result = (scope1, scope3)
+        coefficients[key] = result
+    return result
+
+
+# Divisor and ratios of the greenhouse gases of all fuels which have them
+def get_greenhouse_gas_ratios():
+    return {fuel: model['greenhouse_gas_ratios'] for fuel, model in fuel_models.items()
+            if model.get('greenhouse_gas_ratios') is not None}
@@ -0,0 +1,33 @@
+import json
+
+import aws_clients
+import instrumentation
+
+#-------------------------------------------------------------------------------
+# Transport for calling the other emission functions: they are invoked as
+# Lambda functions and return a dict with statusCode and body.
+# The calculations of the shared layer (emission_calculator) are called
+# directly by the handlers, not through this module.
+#-------------------------------------------------------------------------------
+
+function_arn_prefix = 'arn:aws:lambda:eu-central-1:663325156950:function:'
+
+
+def invoke(function_name, payload):
+    # The Lambda client is created with the first invoke (aws_clients)
+    client = aws_clients.client('lambda')
+    with instrumentation.span("json", "dumps"):
+        request = json.dumps(payload)
+    with instrumentation.span("lambda", function_name) as details:
+        response = client.invoke(
+            FunctionName=function_arn_prefix + function_name,
+            InvocationType='RequestResponse',
+            Payload=request,
+        )
+        response_payload = response['Payload'].read()
+        if details is not None:
+            details["request_bytes"] = len(request)
+            details["response_bytes"] = len(response_payload)
+    # receive the Payload file and transfer it to Json format
+    with instrumentation.span("json", "loads"):
+        return json.loads(response_payload)
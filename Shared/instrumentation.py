@@ -0,0 +1,137 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+#-------------------------------------------------------------------------------
+# Lightweight tracing of the handlers.
+# traced_handler wraps a lambda_handler and collects everything that happens in
+# one invocation: spans of the downstream calls (Lambda invoke, DynamoDB, S3,
+# JSON) with their duration and payload size, and the outcomes of the caches.
+# At the end of the invocation one record is printed in the CloudWatch Embedded
+# Metric Format, so CloudWatch creates the metrics from the log line.
+# TRACE_SAMPLE_RATE (0 to 1, default 1) sets the share of traced invocations,
+# invocations which are not traced only pay for one ContextVar lookup per span.
+# Example:
+#   with instrumentation.span("dynamodb", "batch_get_item") as details:
+#       details["response_bytes"] = ...
+#-------------------------------------------------------------------------------
+
+sample_rate = float(os.environ.get("TRACE_SAMPLE_RATE", "1"))
+namespace = os.environ.get("TRACE_NAMESPACE", "EmissionCalculator")
+# At most this many spans are listed in a record, the metrics contain all
+max_listed_spans = 50
+
+# Record of the running invocation, None if it is not traced. Threads of
+# fan_out work on the record of the invocation which started them.
+current_record = contextvars.ContextVar("current_record", default=None)
+
+
+# Also wraps the async handlers (see async_aws)
+def traced_handler(function_name):
+    def decorator(handler):
+        if inspect.iscoroutinefunction(handler):
+            @functools.wraps(handler)
+            async def async_wrapper(event, context):
+                if not is_traced():
+                    return await handler(event, context)
+                record, token, start = start_record(function_name)
+                reply = None
+                try:
+                    reply = await handler(event, context)
+                    return reply
+                finally:
+                    finish_record(record, token, start, reply)
+            return async_wrapper
+
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            if not is_traced():
+                return handler(event, context)
+            record, token, start = start_record(function_name)
+            reply = None
+            try:
+                reply = handler(event, context)
+                return reply
+            finally:
+                finish_record(record, token, start, reply)
+        return wrapper
+    return decorator
+
+
+# Handlers called in-process by another handler are part of its record
+def is_traced():
+    return current_record.get() is None and sample_rate > 0 and random.random() < sample_rate
+
+
+def start_record(function_name):
+    record = {"function": function_name, "spans": [], "metrics": {}, "lock": threading.Lock()}
+    return record, current_record.set(record), time.perf_counter()
+
+
+def finish_record(record, token, start, reply):
+    current_record.reset(token)
+    record["duration_ms"] = (time.perf_counter() - start) * 1000
+    record["statusCode"] = reply.get("statusCode") if isinstance(reply, dict) else None
+    emit(record)
+
+
+# Measures a downstream call. The yielded dict takes request_bytes and
+# response_bytes, it is None if the invocation is not traced.
+@contextmanager
+def span(backend, operation):
+    record = current_record.get()
+    if record is None:
+        yield None
+        return
+    details = {}
+    start = time.perf_counter()
+    try:
+        yield details
+    finally:
+        duration = (time.perf_counter() - start) * 1000
+        with record["lock"]:
+            add_metric(record, backend + "_calls", 1, "Count")
+            add_metric(record, backend + "_ms", duration, "Milliseconds")
+            for name in ("request_bytes", "response_bytes"):
+                if name in details:
+                    add_metric(record, backend + "_" + name, details[name], "Bytes")
+            if len(record["spans"]) < max_listed_spans:
+                record["spans"].append({"name": backend + "." + operation, "ms": round(duration, 3)})
+
+
+# Counts the outcome of a cache lookup, e.g. record_cache("route", "hit")
+def record_cache(cache_name, outcome):
+    record = current_record.get()
+    if record is None:
+        return
+    with record["lock"]:
+        add_metric(record, cache_name + "_cache_" + outcome, 1, "Count")
+
+
+def add_metric(record, name, value, unit):
+    metric = record["metrics"].setdefault(name, [0, unit])
+    metric[0] += value
+
+
+def emit(record):
+    metrics = [{"Name": "duration_ms", "Unit": "Milliseconds"}]
+    line = {
+        "function": record["function"],
+        "statusCode": record["statusCode"],
+        "duration_ms": round(record["duration_ms"], 3),
+        "spans": record["spans"],
+    }
+    for name, (value, unit) in sorted(record["metrics"].items()):
+        metrics.append({"Name": name, "Unit": unit})
+        line[name] = round(value, 3)
+    line["_aws"] = {
+        "Timestamp": int(time.time() * 1000),
+        "CloudWatchMetrics": [{"Namespace": namespace, "Dimensions": [["function"]], "Metrics": metrics}]
+    }
+    print(json.dumps(line))
@@ -0,0 +1,211 @@
+import contextvars
+import copy
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import async_aws
+import aws_clients
+import electricity_factors
+import factor_version
+import instrumentation
+
+#-------------------------------------------------------------------------------
+# Cache for the replies of whole requests. Most requests repeat (the same
+# commuter trip, the same bus route with the same fuel), so a repeated event is
+# answered without any lookup or calculation.
+# The key is a hash of the normalized event (see canonical_event) and of the
+# versions of the emission factors (factor_version and electricity_factors), so
+# a new factor version starts with an empty cache. Replies are kept in memory of
+# the container and, if RESULT_CACHE_TABLE is set, in a DynamoDB table shared by
+# all containers (key "result", TTL attribute "expires_at").
+# Only successful replies are cached, and only for result_max_age_seconds: the
+# routes and factors a reply was calculated from are read again after that time.
+# Batches and other large events are not cached. Tools set enabled to False to
+# measure the calculation itself (see benchmark_handlers).
+# Example:
+#   @instrumentation.traced_handler("car")
+#   @result_cache.cached_handler("car")
+#   def lambda_handler(event, context):
+#-------------------------------------------------------------------------------
+
+# Same as the factors in memory of the factor_repository
+result_max_age_seconds = 60 * 60
+memory_max_entries = 4096
+# Events with a longer canonical form (e.g. batches) are not cached
+max_event_bytes = 2048
+
+shared_table_name = os.environ.get("RESULT_CACHE_TABLE", "")
+enabled = True
+
+# cache key -> (expires at, reply)
+memory_results = OrderedDict()
+memory_lock = threading.Lock()
+
+# Handlers called by a cached handler (in-process or via async_aws) do not cache
+# again, the reply is stored once by the outermost handler
+inside_cached_handler = contextvars.ContextVar("inside_cached_handler", default=False)
+
+
+# Whole numbers are the same, whether they are sent as 2 or 2.0. Strings are
+# kept as they are, the handlers compare them and echo them in the reply.
+def normalize(value):
+    if isinstance(value, dict):
+        return {str(key): normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+# The event as JSON with sorted keys, None if it cannot be cached
+def canonical_event(event):
+    if not isinstance(event, dict):
+        return None
+    try:
+        canonical = json.dumps(normalize(event), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    except (TypeError, ValueError):
+        return None
+    if len(canonical) > max_event_bytes:
+        return None
+    return canonical
+
+
+def cache_key(function_name, event):
+    canonical = canonical_event(event)
+    if canonical is None:
+        return None
+    scope = "%s|%s|%s" % (function_name, factor_version.check(), electricity_factors.version)
+    return hashlib.sha256((scope + "|" + canonical).encode("utf-8")).hexdigest()
+
+
+# Returns a copy of the cached reply, None if the key is not cached
+def get_memory_result(key, now):
+    with memory_lock:
+        entry = memory_results.get(key)
+        if entry is None or entry[0] <= now:
+            return None
+        memory_results.move_to_end(key)
+    return copy.deepcopy(entry[1])
+
+
+def put_memory_result(key, entry):
+    with memory_lock:
+        memory_results[key] = entry
+        memory_results.move_to_end(key)
+        while len(memory_results) > memory_max_entries:
+            memory_results.popitem(last=False)
+
+
+def get_table():
+    return aws_clients.table(shared_table_name)
+
+
+# Reads the reply from the shared tier, None if it is not there or too old.
+# The cache must never break a request, so errors only lead to a cache miss.
+def get_shared_result(key, now):
+    if not shared_table_name:
+        return None
+    try:
+        with instrumentation.span("dynamodb", "get_item"):
+            item = get_table().get_item(Key={'result': key}).get('Item')
+    except Exception as error:
+        print("Result cache could not be read: " + str(error))
+        return None
+    # DynamoDB removes expired items only some time after expires_at
+    if item is None or int(item['expires_at']) <= now:
+        return None
+    return (int(item['expires_at']), json.loads(item['reply']))
+
+
+def put_shared_result(key, entry):
+    if not shared_table_name:
+        return
+    try:
+        with instrumentation.span("dynamodb", "put_item"):
+            get_table().put_item(Item={'result': key, 'expires_at': int(entry[0]), 'reply': json.dumps(entry[1])})
+    except Exception as error:
+        print("Result cache could not be written: " + str(error))
+
+
+# Returns the cached reply from the memory or the shared tier, None on a miss
+def get_result(key):
+    now = time.time()
+    reply = get_memory_result(key, now)
+    if reply is not None:
+        instrumentation.record_cache("result", "hit")
+        return reply
+    entry = get_shared_result(key, now)
+    if entry is None:
+        instrumentation.record_cache("result", "miss")
+        return None
+    instrumentation.record_cache("result", "shared_hit")
+    put_memory_result(key, entry)
+    return copy.deepcopy(entry[1])
+
+
+# Returns the cache key of the event and its cached reply, the key is None if
+# the event is not cached and the reply is None on a miss
+def lookup(function_name, event):
+    key = cache_key(function_name, event)
+    if key is None:
+        return None, None
+    return key, get_result(key)
+
+
+# Stores a successful reply in both tiers
+def put_result(key, reply):
+    if not isinstance(reply, dict) or reply.get('statusCode') != 200:
+        return
+    entry = (time.time() + result_max_age_seconds, copy.deepcopy(reply))
+    put_memory_result(key, entry)
+    put_shared_result(key, entry)
+
+
+# Also wraps the async handlers (see async_aws)
+def cached_handler(function_name):
+    def decorator(handler):
+        if inspect.iscoroutinefunction(handler):
+            @functools.wraps(handler)
+            async def async_wrapper(event, context):
+                if not enabled or inside_cached_handler.get():
+                    return await handler(event, context)
+                # The version check and the shared tier block, they run on the thread pool
+                key, reply = await async_aws.run(lookup, function_name, event)
+                if key is None:
+                    return await handler(event, context)
+                if reply is not None:
+                    return reply
+                token = inside_cached_handler.set(True)
+                try:
+                    reply = await handler(event, context)
+                finally:
+                    inside_cached_handler.reset(token)
+                await async_aws.run(put_result, key, reply)
+                return reply
+            return async_wrapper
+
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            if not enabled or inside_cached_handler.get():
+                return handler(event, context)
+            key, reply = lookup(function_name, event)
+            if key is None:
+                return handler(event, context)
+            if reply is not None:
+                return reply
+            token = inside_cached_handler.set(True)
+            try:
+                reply = handler(event, context)
+            finally:
+                inside_cached_handler.reset(token)
+            put_result(key, reply)
+            return reply
+        return wrapper
+    return decorator
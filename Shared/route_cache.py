@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import aws_clients
+import instrumentation
+
+#-------------------------------------------------------------------------------
+# Cache for the replies of the route functions (calculateDistanceBetweenAirports,
+# getSpeedValuesBetweenTwoWaypoints), so repeated routes neither invoke the
+# function nor pay for another Google Directions API call.
+# Routes are stored with their normalized origin, destination and mode in
+# memory of the container and, if ROUTE_CACHE_TABLE is set, in a DynamoDB table
+# shared by all containers (key "route", TTL attribute "expires_at").
+# Replies with an error are cached for a short time only (negative caching).
+# Example: get_route("Frankfurt", "Berlin", "driving", fetch) -> reply of fetch()
+#-------------------------------------------------------------------------------
+
+route_max_age_seconds = 7 * 86400
+negative_max_age_seconds = 10 * 60
+memory_max_entries = 1024
+
+shared_table_name = os.environ.get("ROUTE_CACHE_TABLE", "")
+
+# route key -> (expires at, reply)
+memory_routes = OrderedDict()
+memory_lock = threading.Lock()
+
+
+# " Frankfurt  am Main" and "frankfurt am main" are the same place
+def normalize(value):
+    return " ".join(str(value).split()).casefold()
+
+
+def route_key(origin, destination, mode):
+    return "|".join([mode, normalize(origin), normalize(destination)])
+
+
+# Returns the reply of the route, fetch() is only called if it is not cached
+def get_route(origin, destination, mode, fetch):
+    key = route_key(origin, destination, mode)
+    now = time.time()
+
+    with memory_lock:
+        entry = memory_routes.get(key)
+        if entry is not None and entry[0] > now:
+            memory_routes.move_to_end(key)
+            instrumentation.record_cache("route", "hit")
+            return entry[1]
+
+    entry = get_shared_route(key, now)
+    if entry is not None:
+        instrumentation.record_cache("route", "shared_hit")
+    else:
+        instrumentation.record_cache("route", "miss")
+        reply = fetch()
+        max_age = route_max_age_seconds if reply.get('statusCode') == 200 else negative_max_age_seconds
+        entry = (now + max_age, reply)
+        put_shared_route(key, entry)
+
+    with memory_lock:
+        memory_routes[key] = entry
+        memory_routes.move_to_end(key)
+        while len(memory_routes) > memory_max_entries:
+            memory_routes.popitem(last=False)
+    return entry[1]
+
+
+def get_table():
+    return aws_clients.table(shared_table_name)
+
+
+# Reads the route from the shared tier, None if it is not there or too old.
+# The cache must never break a request, so errors only lead to a cache miss.
+def get_shared_route(key, now):
+    if not shared_table_name:
+        return None
+    try:
+        with instrumentation.span("dynamodb", "get_item"):
+            item = get_table().get_item(Key={'route': key}).get('Item')
+    except Exception as error:
+        print("Route cache could not be read: " + str(error))
+        return None
+    # DynamoDB removes expired items only some time after expires_at
+    if item is None or int(item['expires_at']) <= now:
+        return None
+    return (int(item['expires_at']), json.loads(item['reply']))
+
+
+def put_shared_route(key, entry):
+    if not shared_table_name:
+        return
+    try:
+        with instrumentation.span("dynamodb", "put_item"):
+            get_table().put_item(Item={'route': key, 'expires_at': int(entry[0]), 'reply': json.dumps(entry[1])})
+    except Exception as error:
+        print("Route cache could not be written: " + str(error))
@@ -0,0 +1,68 @@
+import math
+
+import vector_math
+
+#-------------------------------------------------------------------------------
+# Consumption of a car trip from the speed profile of its route.
+# If the reply of getSpeedValuesBetweenTwoWaypoints contains the segments of the
+# route (the steps of the directions), the fuel of every segment is calculated
+# from its average speed instead of splitting the route only into city and
+# highway. The consumption of a car depends on its speed: it is high in stop and
+# go traffic, lowest at country road speeds and rises again on the motorway.
+# The speed curves are relative to the combined consumption (the consumption of
+# the request or the "Comb" value of getCarFuelConsumptionAverage), which is
+# measured at the average speed of the WLTP cycle, so the curves are 1.0 there.
+# The consumption of all segments is calculated in one array operation (see
+# vector_math), so a route with thousands of steps costs no extra round-trip.
+# Segments in the route reply, distance in m and duration in s:
+#   "segments": {"distance": [120, 3400, ...], "duration": [25, 180, ...]}
+# Example: get_amount(fuel_models.resolve_model("Diesel"), segments, 0.061) -> l
+#-------------------------------------------------------------------------------
+
+# Speeds (km/h) of the points of the curves
+speed_grid_kmh = [5, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 110, 120, 130, 140, 150]
+
+# Consumption at the speed relative to the combined consumption. The shapes
+# follow the speed dependent fuel consumption of passenger cars (COPERT),
+# electric cars lose less in stop and go traffic (recuperation) and more at
+# high speed (air drag).
+speed_curves = {
+    "combustion": [2.6, 1.9, 1.4, 1.17, 1.05, 0.98, 0.92, 0.89, 0.88, 0.9, 0.95, 1.02, 1.1, 1.2, 1.31, 1.43],
+    "electric": [1.4, 1.2, 1.05, 0.99, 0.98, 1.01, 1.05, 1.11, 1.19, 1.28, 1.39, 1.51, 1.65, 1.8, 1.97, 2.15],
+}
+default_curve = "combustion"
+
+
+# Returns the distances (km) and average speeds (km/h) of the segments of the
+# route reply, None if the reply has no usable segments
+def get_segments(route_body):
+    segments = route_body.get("segments") if isinstance(route_body, dict) else None
+    if not isinstance(segments, dict):
+        return None
+    distances = segments.get("distance")
+    durations = segments.get("duration")
+    if not distances or not isinstance(distances, list) or not isinstance(durations, list) \
+            or len(distances) != len(durations):
+        return None
+    # A segment which is not a number (e.g. null) makes the segments unusable,
+    # the route is then split into city and highway like without segments
+    try:
+        distances_km = [float(distance) / 1000 for distance in distances]
+        durations_s = [float(duration) for duration in durations]
+    except (TypeError, ValueError):
+        return None
+    if not all(math.isfinite(value) and value >= 0 for value in distances_km + durations_s):
+        return None
+    # A segment with a duration of 0 gets the highest speed of the curves
+    speeds_kmh = [distance_km / (duration / 3600) if duration > 0 else speed_grid_kmh[-1]
+                  for distance_km, duration in zip(distances_km, durations_s)]
+    return distances_km, speeds_kmh
+
+
+# Amount of fuel (l, kg or kwh) of all segments. combined_per_km is the combined
+# consumption of the car per km.
+def get_amount(model, segments, combined_per_km):
+    distances_km, speeds_kmh = segments
+    curve = speed_curves[model.get('speed_curve', default_curve)]
+    relative_consumption = vector_math.interpolate(speeds_kmh, speed_grid_kmh, curve)
+    return combined_per_km * vector_math.dot(distances_km, relative_consumption)
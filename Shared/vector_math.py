@@ -0,0 +1,80 @@
+import bisect
+
+#-------------------------------------------------------------------------------
+# Array math for the batch calculations.
+# NumPy is used if it is part of the deployment (e.g. as an additional layer),
+# otherwise the same operations run in plain Python. Both return lists, so the
+# results can be put directly into the JSON replies.
+# NumPy takes long to import, so it is only imported with the first batch and
+# functions which never calculate a batch start without it.
+#-------------------------------------------------------------------------------
+
+# The numpy module, None if it is not deployed, unset before the first batch
+numpy_module = False
+
+
+def get_numpy():
+    global numpy_module
+    if numpy_module is False:
+        try:
+            import numpy
+            numpy_module = numpy
+        except ImportError:
+            numpy_module = None
+    return numpy_module
+
+
+# Multiplies every row with its factor: rows[i][j] * factors[i]
+def scale_rows(rows, factors):
+    if not rows:
+        return []
+    numpy = get_numpy()
+    if numpy is not None:
+        return (numpy.asarray(rows, dtype=float) * numpy.asarray(factors, dtype=float)[:, None]).tolist()
+    return [[value * factor for value in row] for row, factor in zip(rows, factors)]
+
+
+# Multiplies every value with every ratio: values[i] * ratios[j]
+def outer(values, ratios):
+    numpy = get_numpy()
+    if numpy is not None:
+        return numpy.outer(numpy.asarray(values, dtype=float), numpy.asarray(ratios, dtype=float)).tolist()
+    return [[value * ratio for ratio in ratios] for value in values]
+
+
+# Sums up the columns of the rows
+def column_sums(rows, columns):
+    if not rows:
+        return [0.0] * columns
+    numpy = get_numpy()
+    if numpy is not None:
+        return numpy.asarray(rows, dtype=float).sum(axis=0).tolist()
+    return [sum(column) for column in zip(*rows)]
+
+
+# Linear interpolation of the values at the points, grid is sorted. Points
+# outside of the grid get the value of its first or last point.
+def interpolate(points, grid, values):
+    numpy = get_numpy()
+    if numpy is not None:
+        return numpy.interp(numpy.asarray(points, dtype=float), grid, values).tolist()
+    result = []
+    last = len(grid) - 1
+    for point in points:
+        upper = bisect.bisect_left(grid, point)
+        if upper == 0:
+            result.append(values[0])
+        elif upper > last:
+            result.append(values[last])
+        else:
+            share = (point - grid[upper - 1]) / (grid[upper] - grid[upper - 1])
+            result.append(values[upper - 1] + (values[upper] - values[upper - 1]) * share)
+    return result
+
+
+# Sum of the products of two vectors
+def dot(first, second):
+    numpy = get_numpy()
+    if numpy is not None:
+        return float(numpy.dot(numpy.asarray(first, dtype=float), numpy.asarray(second, dtype=float)))
+    return sum(value * other for value, other in zip(first, second))
@@ -0,0 +1,219 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+tools_directory = os.path.dirname(os.path.abspath(__file__))
+repository_directory = os.path.dirname(tools_directory)
+sys.path.insert(0, tools_directory)
+import fake_aws
+
+#-------------------------------------------------------------------------------
+# Offline benchmark of the four lambda_handler entry points (Flight, Car, Bus,
+# GreenHouseGas). Lambda invoke, DynamoDB and S3 are replaced by the in-process
+# stand-ins of fake_aws with a configurable latency per backend.
+# For every handler it reports:
+#   cold: import of the handler plus its first request (percentiles in ms)
+#   warm: further requests of the same container with the result_cache switched
+#         off, so every request is calculated (percentiles in ms)
+#   warm cached: the same requests answered from the result_cache
+#   calls per request to every backend, cold, warm and warm cached
+#   throughput (requests per second) with concurrent requests, calculated
+# The results can be saved as JSON baseline and compared with a later run.
+# Example: python Tools/benchmark_handlers.py --latency lambda=30,dynamodb=5,s3=20 --save baseline.json
+#          python Tools/benchmark_handlers.py --latency lambda=30,dynamodb=5,s3=20 --compare baseline.json
+#-------------------------------------------------------------------------------
+
+# name -> (directory, module, example event)
+handlers = {
+    "flight": ("Flight", "calculateCarbonEmissionFlightForTravel",
+               {"airplane_name": "A380", "fromIATA": "BER", "toIATA": "FRA", "passenger": 2}),
+    "car": ("Car", "calculateCarbonEmissionBusForTravel",
+            {"Origin": "Frankfurt", "Destination": "Berlin", "fuel": "Diesel", "fuel consumption": "-1",
+             "VClass": "Compact Cars", "productionYear": 2015}),
+    "bus": ("Bus", "calculateCarbonEmissionBusForTravel",
+            {"Origin": "Frankfurt", "Destination": "Berlin", "fuel": "1"}),
+    "greenhousegas": ("GreenHouseGas", "getAllGreenHouseGasOfCO2",
+                      {"CO2": 0.5, "fuel": "Diesel"}),
+}
+
+handler_directories = [os.path.join(repository_directory, directory) for directory, module, event in handlers.values()]
+shared_directory = os.path.join(repository_directory, "Shared")
+
+
+# Imports the handler like a new container would: all modules of the repository
+# which were imported before are removed first
+def load_handler(directory, module_name):
+    for name, module in list(sys.modules.items()):
+        module_file = getattr(module, "__file__", None) or ""
+        if module_file.startswith(repository_directory + os.sep) and not module_file.startswith(tools_directory):
+            del sys.modules[name]
+    sys.path[:] = [path for path in sys.path if path not in handler_directories and path != shared_directory]
+    sys.path[:0] = [os.path.join(repository_directory, directory), shared_directory]
+    return importlib.import_module(module_name)
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {}
+
+    def percentile(share):
+        return round(values[min(len(values) - 1, int(share * len(values)))], 3)
+    return {"p50": percentile(0.5), "p90": percentile(0.9), "p99": percentile(0.99),
+            "mean": round(sum(values) / len(values), 3), "runs": len(values)}
+
+
+def calls_per_request(calls, requests):
+    return {name: round(number / requests, 3) for name, number in sorted(calls.items())}
+
+
+# Switches the result_cache of the loaded handler on or off, the GHG handler has none
+def set_result_cache(enabled):
+    result_cache = sys.modules.get("result_cache")
+    if result_cache is not None:
+        result_cache.enabled = enabled
+
+
+def benchmark_handler(name, cold_runs, warm_runs, concurrency, throughput_requests):
+    directory, module_name, event = handlers[name]
+    cold_ms = []
+    status_codes = {}
+    cold_calls = {}
+    # True: answered from the result_cache, False: calculated
+    warm_ms = {False: [], True: []}
+    warm_calls = {False: {}, True: {}}
+
+    for run in range(cold_runs):
+        fake_aws.reset_calls()
+        start = time.perf_counter()
+        module = load_handler(directory, module_name)
+        reply = module.lambda_handler(dict(event), None)
+        cold_ms.append((time.perf_counter() - start) * 1000)
+        for call, number in fake_aws.calls.items():
+            cold_calls[call] = cold_calls.get(call, 0) + number
+        status_codes[str(reply.get('statusCode'))] = status_codes.get(str(reply.get('statusCode')), 0) + 1
+
+        # The cold request stored its reply, the cached runs repeat it
+        for cached in (False, True) if "result_cache" in sys.modules else (False,):
+            set_result_cache(cached)
+            fake_aws.reset_calls()
+            for warm_run in range(warm_runs):
+                start = time.perf_counter()
+                reply = module.lambda_handler(dict(event), None)
+                warm_ms[cached].append((time.perf_counter() - start) * 1000)
+                status_codes[str(reply.get('statusCode'))] = status_codes.get(str(reply.get('statusCode')), 0) + 1
+            for call, number in fake_aws.calls.items():
+                warm_calls[cached][call] = warm_calls[cached].get(call, 0) + number
+
+    # Throughput of one warm container with concurrent requests, all of them calculated
+    set_result_cache(False)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(lambda number: module.lambda_handler(dict(event), None), range(throughput_requests)))
+    duration = time.perf_counter() - start
+    set_result_cache(True)
+
+    return {
+        "cold_ms": percentiles(cold_ms),
+        "warm_ms": percentiles(warm_ms[False]),
+        "warm_cached_ms": percentiles(warm_ms[True]),
+        "cold_calls_per_request": calls_per_request(cold_calls, cold_runs),
+        "warm_calls_per_request": calls_per_request(warm_calls[False], max(cold_runs * warm_runs, 1)),
+        "warm_cached_calls_per_request": calls_per_request(warm_calls[True], max(cold_runs * warm_runs, 1)),
+        "throughput_rps": round(throughput_requests / duration, 1),
+        "status_codes": status_codes,
+    }
+
+
+# Compares the results with a baseline, returns False if a latency got worse
+# by more than max_regression (0.2 = 20 %) and more than min_delta_ms, or the
+# throughput dropped by more than max_regression
+def compare(results, baseline, max_regression, min_delta_ms):
+    passed = True
+    print("%-14s %-16s %12s %12s %9s" % ("handler", "metric", "baseline", "current", "change"))
+    for name, result in results["handlers"].items():
+        if name not in baseline["handlers"]:
+            continue
+        old = baseline["handlers"][name]
+        metrics = [("cold p50 ms", old["cold_ms"].get("p50"), result["cold_ms"].get("p50"), 1),
+                   ("warm p50 ms", old["warm_ms"].get("p50"), result["warm_ms"].get("p50"), 1),
+                   ("warm p99 ms", old["warm_ms"].get("p99"), result["warm_ms"].get("p99"), 1),
+                   ("cached p50 ms", old.get("warm_cached_ms", {}).get("p50"), result["warm_cached_ms"].get("p50"), 1),
+                   ("throughput rps", old["throughput_rps"], result["throughput_rps"], -1)]
+        for metric, old_value, new_value, direction in metrics:
+            if not old_value or new_value is None:
+                continue
+            change = (new_value - old_value) / old_value
+            regression = change * direction > max_regression
+            # Differences of fractions of a millisecond are noise
+            if direction == 1 and new_value - old_value < min_delta_ms:
+                regression = False
+            passed = passed and not regression
+            print("%-14s %-16s %12.3f %12.3f %+8.1f%%%s" % (name, metric, old_value, new_value, change * 100,
+                                                          "  REGRESSION" if regression else ""))
+    return passed
+
+
+def parse_latency(text):
+    latency = {}
+    for part in filter(None, text.split(",")):
+        backend, milliseconds = part.split("=")
+        latency[backend.strip()] = float(milliseconds) / 1000
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the lambda handlers")
+    parser.add_argument("--handlers", default=",".join(handlers), help="comma separated, default: all")
+    parser.add_argument("--latency", default="lambda=20,dynamodb=5,s3=10",
+                        help="injected latency in ms per backend, e.g. lambda=20,dynamodb=5,s3=10")
+    parser.add_argument("--cold-runs", type=int, default=5)
+    parser.add_argument("--warm-runs", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--throughput-requests", type=int, default=200)
+    parser.add_argument("--save", help="writes the results as JSON baseline")
+    parser.add_argument("--compare", help="JSON baseline to compare the results with")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    parser.add_argument("--min-delta-ms", type=float, default=1.0)
+    arguments = parser.parse_args()
+
+    fake_aws.install()
+    fake_aws.latency.update(parse_latency(arguments.latency))
+
+    results = {
+        "settings": {
+            "latency_ms": {backend: seconds * 1000 for backend, seconds in fake_aws.latency.items()},
+            "cold_runs": arguments.cold_runs,
+            "warm_runs": arguments.warm_runs,
+            "concurrency": arguments.concurrency,
+            "throughput_requests": arguments.throughput_requests,
+        },
+        "handlers": {},
+    }
+    for name in arguments.handlers.split(","):
+        # The handlers print their progress, it is not part of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            results["handlers"][name] = benchmark_handler(name, arguments.cold_runs, arguments.warm_runs,
+                                                          arguments.concurrency, arguments.throughput_requests)
+        print(json.dumps({name: results["handlers"][name]}, indent=2))
+
+    if arguments.save:
+        with open(arguments.save, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print("Baseline saved to " + arguments.save)
+
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if not compare(results, baseline, arguments.max_regression, arguments.min_delta_ms):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+tools_directory = os.path.dirname(os.path.abspath(__file__))
+repository_directory = os.path.dirname(tools_directory)
+
+#-------------------------------------------------------------------------------
+# Startup benchmark of the handler modules: how long the import of a handler
+# takes in a new Python process, like in a new container (cold start).
+# Every handler is imported --runs times in its own process with the path of
+# its Lambda function (Shared layer plus its directory). It reports the median
+# import time and the cost of every module (python -X importtime): the modules
+# of the repository and the third-party packages, largest first.
+# It fails (exit code 1) if a handler needs more than its budget, or if a
+# handler which must only use the standard library imports another package.
+# No AWS call is made, the handlers must not reach AWS while they are imported.
+# Example: python Tools/benchmark_imports.py --budget car=30,flight=30 --top 5
+#-------------------------------------------------------------------------------
+
+# name -> (directory, module)
+handlers = {
+    "flight": ("Flight", "calculateCarbonEmissionFlightForTravel"),
+    "car": ("Car", "calculateCarbonEmissionBusForTravel"),
+    "bus": ("Bus", "calculateCarbonEmissionBusForTravel"),
+    "greenhousegas": ("GreenHouseGas", "getAllGreenHouseGasOfCO2"),
+    "factorstream": ("FactorStream", "refreshEmissionFactorsOnChange"),
+    "emissionrollup": ("EmissionRollup", "rollupEmissions"),
+}
+
+# Import budget in ms of every handler
+budgets_ms = {"flight": 40, "car": 40, "bus": 40, "greenhousegas": 20, "factorstream": 40,
+              "emissionrollup": 40}
+
+# Handlers which may only import the standard library (and the repository)
+standard_library_only = {"greenhousegas"}
+
+# Runs in the new process: imports the handler and reports its time, the
+# modules it imported and which of their packages belong to the standard
+# library. The marker separates the imports of the interpreter start (site,
+# .pth files) from the handler.
+# sys.stdlib_module_names exists since Python 3.10, before that a package
+# belongs to the standard library if it is built in or its file is in the
+# stdlib directory but not in site-packages.
+import_script = """
+import json, os, sys, sysconfig, time
+before = set(sys.modules)
+sys.stderr.write("benchmark_imports: start\\n")
+start = time.perf_counter()
+import %s
+duration = time.perf_counter() - start
+modules = sorted(set(sys.modules) - before)
+
+def is_standard_library(package):
+    if hasattr(sys, "stdlib_module_names"):
+        return package in sys.stdlib_module_names
+    if package in sys.builtin_module_names:
+        return True
+    module_file = getattr(sys.modules.get(package), "__file__", None)
+    if not module_file:
+        return False
+    paths = sysconfig.get_paths()
+    module_file = os.path.realpath(module_file)
+    inside = lambda names: any(module_file.startswith(os.path.realpath(paths[name]) + os.sep) for name in names)
+    return inside(("stdlib", "platstdlib")) and not inside(("purelib", "platlib"))
+
+packages = {module.split(".")[0] for module in modules}
+print(json.dumps({"ms": duration * 1000, "modules": modules,
+                  "standard_library": sorted(filter(is_standard_library, packages))}))
+"""
+
+
+def repository_modules(directory):
+    names = set()
+    for module_directory in (os.path.join(repository_directory, "Shared"), os.path.join(repository_directory, directory)):
+        names.update(file_name[:-3] for file_name in os.listdir(module_directory) if file_name.endswith(".py"))
+    return names
+
+
+# Parses the lines of -X importtime after the marker: module -> (self us, cumulative us)
+def parse_importtime(stderr):
+    costs = {}
+    started = False
+    for line in stderr.splitlines():
+        if line == "benchmark_imports: start":
+            started = True
+            continue
+        if not started or not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        costs[name.strip()] = (int(self_us), int(cumulative_us))
+    return costs
+
+
+def import_once(directory, module_name):
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = os.pathsep.join([os.path.join(repository_directory, "Shared"),
+                                                 os.path.join(repository_directory, directory)])
+    environment.setdefault("AWS_DEFAULT_REGION", "eu-central-1")
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", import_script % module_name],
+                             cwd=repository_directory, env=environment, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError("Import of " + module_name + " failed:\n" + process.stderr[-2000:])
+    # The handlers may print while they are imported, the report is the last line
+    report = json.loads(process.stdout.strip().splitlines()[-1])
+    return report, parse_importtime(process.stderr)
+
+
+# Sums up the self time of the modules per repository module and per package.
+# Failed imports (e.g. optional modules) are listed by -X importtime too, only
+# the imported modules are counted.
+def module_costs(costs, modules, own_modules, standard_library):
+    grouped = {}
+    for name, (self_us, cumulative_us) in costs.items():
+        if name not in modules:
+            continue
+        package = name.split(".")[0]
+        if package in own_modules:
+            group = package
+        elif package in standard_library or package.startswith("_"):
+            group = "(standard library)"
+        else:
+            group = package + " (third-party)"
+        grouped[group] = grouped.get(group, 0) + self_us
+    return grouped
+
+
+def benchmark_handler(name, runs, top):
+    directory, module_name = handlers[name]
+    own_modules = repository_modules(directory)
+    durations = []
+    costs_per_run = []
+    for run in range(runs):
+        report, costs = import_once(directory, module_name)
+        durations.append(report["ms"])
+        modules = set(report["modules"])
+        standard_library = set(report["standard_library"])
+        costs_per_run.append(module_costs(costs, modules, own_modules, standard_library))
+
+    groups = set().union(*costs_per_run)
+    median_costs = {group: statistics.median(costs.get(group, 0) for costs in costs_per_run) / 1000 for group in groups}
+    largest = sorted(median_costs.items(), key=lambda item: item[1], reverse=True)[:top]
+    third_party = sorted({module.split(".")[0] for module in modules
+                          if module.split(".")[0] not in standard_library
+                          and module.split(".")[0] not in own_modules
+                          and not module.startswith("_")})
+    return {
+        "import_ms": round(statistics.median(durations), 3),
+        "import_ms_min": round(min(durations), 3),
+        "modules_ms": {group: round(milliseconds, 3) for group, milliseconds in largest},
+        "third_party_packages": third_party,
+    }
+
+
+def parse_budgets(text):
+    budgets = {}
+    for part in filter(None, text.split(",")):
+        name, milliseconds = part.split("=")
+        budgets[name.strip()] = float(milliseconds)
+    return budgets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time of the handler modules")
+    parser.add_argument("--handlers", default=",".join(handlers), help="comma separated, default: all")
+    parser.add_argument("--runs", type=int, default=5, help="new processes per handler")
+    parser.add_argument("--top", type=int, default=8, help="modules listed per handler")
+    parser.add_argument("--budget", default="", help="import budget in ms per handler, e.g. car=30,flight=30")
+    parser.add_argument("--save", help="writes the results as JSON")
+    arguments = parser.parse_args()
+    budgets_ms.update(parse_budgets(arguments.budget))
+
+    results = {}
+    failures = []
+    for name in arguments.handlers.split(","):
+        result = benchmark_handler(name, arguments.runs, arguments.top)
+        result["budget_ms"] = budgets_ms[name]
+        results[name] = result
+        print(json.dumps({name: result}, indent=2))
+        if result["import_ms"] > budgets_ms[name]:
+            failures.append("%s: import takes %.1f ms, the budget is %.1f ms" % (name, result["import_ms"], budgets_ms[name]))
+        if name in standard_library_only and result["third_party_packages"]:
+            failures.append(name + " must only import the standard library, it imports: " + ", ".join(result["third_party_packages"]))
+
+    if arguments.save:
+        with open(arguments.save, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+        print("Results saved to " + arguments.save)
+
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Shared"))
+import factor_snapshot
+
+#-------------------------------------------------------------------------------
+# Build step for the binary factor snapshot of the shared layer.
+# Reads all rows of the factor tables (or a JSON snapshot with the same tables)
+# and writes them into Shared/factor_snapshot.bin, which is then deployed
+# with the layer and memory-mapped by the factor_repository.
+# The snapshot is stamped with the factor_version it was read at, a container
+# drops it if the factors were changed after the build (see factor_repository).
+# Example: python Tools/build_factor_snapshot.py --version 2026-10-18
+#          python Tools/build_factor_snapshot.py --from-json factors.json --factor-version 12
+#-------------------------------------------------------------------------------
+
+# Tables and the name of their key
+snapshot_tables = {
+    "EmissionFactorsAfterDIN16258": "fuel_type",
+    "EmissionFactorsFuel_WTT": "fuel_type",
+    "AircraftCapacity": "Aircraft",
+}
+
+default_output = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Shared", "factor_snapshot.bin")
+
+
+# Reads all items of a table, scan returns at most 1 MB per call
+def scan_table(dynamodb, table_name):
+    table = dynamodb.Table(table_name)
+    response = table.scan()
+    items = response['Items']
+    while 'LastEvaluatedKey' in response:
+        response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
+        items.extend(response['Items'])
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds the binary emission factor snapshot")
+    parser.add_argument("--output", default=default_output)
+    parser.add_argument("--version", default=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    parser.add_argument("--from-json", help="JSON snapshot {\"tables\": {\"table name\": [items]}} instead of DynamoDB")
+    parser.add_argument("--factor-version", type=int,
+                        help="factor_version of the items, read from the marker if they come from DynamoDB")
+    arguments = parser.parse_args()
+
+    factor_version = arguments.factor_version
+    if arguments.from_json:
+        with open(arguments.from_json) as json_file:
+            snapshot = json.load(json_file)
+        items = snapshot["tables"]
+        if factor_version is None:
+            factor_version = snapshot.get("factor_version")
+    else:
+        import boto3
+        if factor_version is None:
+            # The marker is read before the tables, a change during the scan
+            # makes the snapshot look older than it is, not newer
+            import factor_version as factor_version_marker
+            marker, etag = factor_version_marker.read_marker()
+            factor_version = marker["version"] if marker is not None else 0
+        dynamodb = boto3.resource('dynamodb')
+        items = {table_name: scan_table(dynamodb, table_name) for table_name in snapshot_tables}
+
+    tables = {table_name: {"key": snapshot_tables.get(table_name, "fuel"), "items": table_items}
+              for table_name, table_items in items.items()}
+    factor_snapshot.write_snapshot(arguments.output, arguments.version, tables, factor_version)
+    for table_name, table in tables.items():
+        print(table_name + ": " + str(len(table["items"])) + " items")
+    print("Snapshot written to " + arguments.output + " (" + str(os.path.getsize(arguments.output)) + " bytes)"
+          + ", factor version: " + str(factor_version))
+
+
+if __name__ == "__main__":
+    main()
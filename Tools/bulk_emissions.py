@@ -0,0 +1,270 @@
+import argparse
+import asyncio
+import contextlib
+import csv
+import importlib.util
+import io
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+tools_directory = os.path.dirname(os.path.abspath(__file__))
+repository_directory = os.path.dirname(tools_directory)
+
+#-------------------------------------------------------------------------------
+# Streaming bulk calculator for travel exports (CSV or JSONL).
+# Every row has a column "mode" (flight, car, bus or ghg) and the fields of the
+# event of the matching lambda_handler, e.g.
+#   mode,airplane_name,fromIATA,toIATA,passenger,Origin,Destination,fuel,fuel consumption,CO2
+#   flight,A380,BER,FRA,2,,,,,
+#   bus,,,,,Frankfurt,Berlin,1,,
+# The file is read in chunks, the rows of a chunk are calculated on a bounded
+# worker pool (all flights, buses and ghg rows of a chunk in one batch call each)
+# and the results are appended to the output (JSONL, one line per row), so the
+# memory does not grow with the size of the file. After every chunk a
+# checkpoint is written, an interrupted run continues from there with --resume.
+# Example: python Tools/bulk_emissions.py travel.csv results.jsonl --workers 8
+#          python Tools/bulk_emissions.py travel.csv results.jsonl --resume
+# --offline uses the stand-ins of fake_aws instead of AWS.
+# --async runs the rows of a chunk on an event loop (lambda_handler_async of the
+# handlers, see async_aws) instead of the worker pool, with at most
+# --concurrency-limit downstream calls in flight on --pool-size threads.
+# With EMISSION_STORE_PREFIX the trips are recorded in the emission_store, its
+# rows are written once per chunk, before the checkpoint.
+#-------------------------------------------------------------------------------
+
+# mode -> (directory, module of the lambda_handler)
+handler_modules = {
+    "flight": ("Flight", "calculateCarbonEmissionFlightForTravel"),
+    "car": ("Car", "calculateCarbonEmissionBusForTravel"),
+    "bus": ("Bus", "calculateCarbonEmissionBusForTravel"),
+    "ghg": ("GreenHouseGas", "getAllGreenHouseGasOfCO2"),
+}
+mode_aliases = {"greenhousegas": "ghg", "plane": "flight"}
+# Modes whose handler has a batch mode -> field of the list in the batch event
+batch_modes = {"flight": "legs", "bus": "trips", "ghg": "trips"}
+
+# Fields which the handlers expect as numbers
+number_fields = {"passenger": float, "CO2": float}
+
+
+# Loads the handler module from its directory under an own name, because
+# the car and the bus module have the same name
+def load_handler(mode):
+    directory, module_name = handler_modules[mode]
+    handler_directory = os.path.join(repository_directory, directory)
+    for path in (os.path.join(repository_directory, "Shared"), handler_directory):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    spec = importlib.util.spec_from_file_location(mode + "_" + module_name,
+                                                  os.path.join(handler_directory, module_name + ".py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def read_rows(path, file_format):
+    with open(path, newline="") as input_file:
+        if file_format == "csv":
+            for row in csv.DictReader(input_file):
+                yield row
+        else:
+            for line in input_file:
+                if not line.strip():
+                    continue
+                # A broken line gets an error result like any other bad row
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield line
+
+
+# Turns a row of the export into the mode and the event of the handler
+def to_event(row):
+    if not isinstance(row, dict):
+        raise ValueError("the row has to be an object")
+    event = {}
+    for name, value in row.items():
+        # Empty CSV cells are treated like missing fields
+        if name is None or value is None or value == "":
+            continue
+        if name in number_fields and isinstance(value, str):
+            value = number_fields[name](value)
+        event[name.strip()] = value
+    mode = str(event.pop("mode", "")).strip().lower()
+    return mode_aliases.get(mode, mode), event
+
+
+# Turns the rows of a chunk into events. A row which cannot be converted gets
+# the event None and a 400 reply, so one bad row never stops the export.
+def to_events(chunk):
+    events = []
+    replies = [None] * len(chunk)
+    for index, row in enumerate(chunk):
+        try:
+            events.append(to_event(row))
+        except (AttributeError, TypeError, ValueError) as error:
+            mode = str(row.get("mode", "")).strip().lower() if isinstance(row, dict) else ""
+            events.append((mode_aliases.get(mode, mode), None))
+            replies[index] = {'statusCode': 400, 'body': "row could not be read: " + str(error)}
+    return events, replies
+
+
+# Indices of the convertible rows of a mode
+def get_batch_rows(events, mode):
+    return [index for index, (row_mode, event) in enumerate(events) if row_mode == mode and event is not None]
+
+
+def calculate_chunk(chunk, handlers, executor):
+    events, replies = to_events(chunk)
+
+    def calculate(mode, event):
+        if mode not in handlers:
+            return {'statusCode': 400, 'body': "unknown mode: " + mode}
+        try:
+            return handlers[mode](event, None)
+        except Exception as error:
+            return {'statusCode': 500, 'body': type(error).__name__ + ": " + str(error)}
+
+    # All flights, buses and ghg rows of the chunk are calculated in one batch call each
+    for mode, batch_field in batch_modes.items():
+        batch_rows = get_batch_rows(events, mode)
+        if batch_rows:
+            batch_reply = calculate(mode, {batch_field: [events[index][1] for index in batch_rows]})
+            for index, reply in zip(batch_rows, batch_reply.get(batch_field, [batch_reply] * len(batch_rows))):
+                replies[index] = reply
+
+    other_rows = [index for index, (mode, event) in enumerate(events) if mode not in batch_modes and event is not None]
+    for index, reply in zip(other_rows, executor.map(lambda index: calculate(*events[index]), other_rows)):
+        replies[index] = reply
+    return [(mode, reply) for (mode, event), reply in zip(events, replies)]
+
+
+# Same as calculate_chunk, all batch calls and rows of the chunk run at the same
+# time on the event loop. Handlers without lambda_handler_async run on the
+# thread pool of async_aws.
+async def calculate_chunk_async(chunk, handlers, async_handlers):
+    import async_aws
+    events, replies = to_events(chunk)
+
+    async def calculate(mode, event):
+        if mode not in handlers:
+            return {'statusCode': 400, 'body': "unknown mode: " + mode}
+        try:
+            if async_handlers.get(mode) is not None:
+                return await async_handlers[mode](event, None)
+            return await async_aws.run(handlers[mode], event, None)
+        except Exception as error:
+            return {'statusCode': 500, 'body': type(error).__name__ + ": " + str(error)}
+
+    calls = []
+    for mode, batch_field in batch_modes.items():
+        batch_rows = get_batch_rows(events, mode)
+        if batch_rows:
+            calls.append((batch_rows, batch_field, calculate(mode, {batch_field: [events[index][1] for index in batch_rows]})))
+    for index, (mode, event) in enumerate(events):
+        if mode not in batch_modes and event is not None:
+            calls.append(([index], None, calculate(mode, event)))
+
+    batch_replies = await asyncio.gather(*[call for rows, batch_field, call in calls])
+    for (rows, batch_field, call), batch_reply in zip(calls, batch_replies):
+        if batch_field is None:
+            replies[rows[0]] = batch_reply
+            continue
+        for index, reply in zip(rows, batch_reply.get(batch_field, [batch_reply] * len(rows))):
+            replies[index] = reply
+    return [(mode, reply) for (mode, event), reply in zip(events, replies)]
+
+
+def read_checkpoint(path):
+    if not os.path.exists(path):
+        return {"rows_done": 0, "output_bytes": 0}
+    with open(path) as checkpoint_file:
+        return json.load(checkpoint_file)
+
+
+# The checkpoint is replaced atomically, so it is never half written
+def write_checkpoint(path, checkpoint):
+    with open(path + ".tmp", "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(path + ".tmp", path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calculates the emissions of a travel export")
+    parser.add_argument("input", help="CSV or JSONL file")
+    parser.add_argument("output", help="JSONL file with one result per row")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="default: from the file extension")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--resume", action="store_true", help="continue from the checkpoint of the output")
+    parser.add_argument("--offline", action="store_true", help="use the stand-ins of fake_aws instead of AWS")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="asyncio execution mode")
+    parser.add_argument("--concurrency-limit", type=int, default=64, help="downstream calls in flight with --async")
+    parser.add_argument("--pool-size", type=int, default=32, help="threads of the blocking calls with --async")
+    parser.add_argument("--lookup-timeout", type=float, default=60,
+                        help="seconds for the lookups of one batch, there is no Lambda context")
+    arguments = parser.parse_args()
+
+    file_format = arguments.format or ("jsonl" if arguments.input.endswith((".jsonl", ".json")) else "csv")
+    checkpoint_path = arguments.output + ".checkpoint"
+    checkpoint = read_checkpoint(checkpoint_path) if arguments.resume else {"rows_done": 0, "output_bytes": 0}
+
+    if arguments.offline:
+        sys.path.insert(0, tools_directory)
+        import fake_aws
+        fake_aws.install()
+    modules = {mode: load_handler(mode) for mode in handler_modules}
+    handlers = {mode: module.lambda_handler for mode, module in modules.items()}
+    async_handlers = {mode: getattr(module, "lambda_handler_async", None) for mode, module in modules.items()}
+
+    # A batch has many more lookups than a single request
+    import fan_out
+    fan_out.default_timeout_seconds = arguments.lookup_timeout
+    if arguments.use_async:
+        import async_aws
+        async_aws.configure(arguments.concurrency_limit, arguments.pool_size)
+    # One part per chunk instead of one per batch call
+    import emission_store
+    emission_store.flush_rows = max(emission_store.flush_rows, emission_store.max_buffer_rows)
+    emission_store.flush_seconds = float("inf")
+
+    # Results which were written after the last checkpoint are written again
+    with open(arguments.output, "a") as output_file:
+        output_file.truncate(checkpoint["output_bytes"])
+
+    rows = read_rows(arguments.input, file_format)
+    rows = itertools.islice(rows, checkpoint["rows_done"], None)
+    row_number = checkpoint["rows_done"]
+    summary = {}
+
+    with ThreadPoolExecutor(max_workers=arguments.workers) as executor, open(arguments.output, "a") as output_file:
+        while True:
+            chunk = list(itertools.islice(rows, arguments.chunk_size))
+            if not chunk:
+                break
+            # The handlers print their progress, it is not part of the output
+            with contextlib.redirect_stdout(io.StringIO()):
+                if arguments.use_async:
+                    results = asyncio.run(calculate_chunk_async(chunk, handlers, async_handlers))
+                else:
+                    results = calculate_chunk(chunk, handlers, executor)
+            for mode, reply in results:
+                output_file.write(json.dumps({"row": row_number, "mode": mode, "result": reply}, default=str) + "\n")
+                status = str(reply.get("statusCode")) if isinstance(reply, dict) else "None"
+                summary[mode + " " + status] = summary.get(mode + " " + status, 0) + 1
+                row_number += 1
+            emission_store.flush()
+            output_file.flush()
+            os.fsync(output_file.fileno())
+            write_checkpoint(checkpoint_path, {"rows_done": row_number, "output_bytes": output_file.tell(),
+                                               "input": os.path.abspath(arguments.input)})
+            print("rows done: " + str(row_number), file=sys.stderr)
+
+    print(json.dumps({"rows": row_number, "status": summary}))
+
+
+if __name__ == "__main__":
+    main()
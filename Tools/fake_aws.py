@@ -0,0 +1,290 @@
+import io
+import json
+import sys
+import threading
+import time
+import types
+from decimal import Decimal
+
+#-------------------------------------------------------------------------------
+# In-process stand-ins for the AWS services the handlers use (Lambda invoke,
+# DynamoDB, S3), so the handlers can run offline, e.g. in the benchmark.
+# install() puts a fake boto3/botocore into sys.modules, it has to be called
+# before a handler is imported. Every call is counted per backend and
+# operation and can be slowed down by an injected latency per backend.
+# The remote Lambda functions which are not part of this repository answer
+# with fixed, plausible values.
+#-------------------------------------------------------------------------------
+
+# Injected latency in seconds per backend: "lambda", "dynamodb", "s3"
+latency = {"lambda": 0.0, "dynamodb": 0.0, "s3": 0.0}
+
+# "backend.operation" -> number of calls
+calls = {}
+calls_lock = threading.Lock()
+
+# DynamoDB tables: name -> {"key": key attribute, "items": {key: item}}
+tables = {}
+# S3 objects: key -> bytes
+objects = {}
+# S3 objects: key -> Metadata and ContentEncoding of the object
+object_details = {}
+# Remote Lambda functions: name -> handler(event)
+functions = {}
+
+
+def count(backend, operation):
+    with calls_lock:
+        name = backend + "." + operation
+        calls[name] = calls.get(name, 0) + 1
+    if latency.get(backend):
+        time.sleep(latency[backend])
+
+
+def reset_calls():
+    with calls_lock:
+        calls.clear()
+
+
+class ClientError(Exception):
+
+    def __init__(self, code, operation_name="fake"):
+        super().__init__("An error occurred (" + code + ") when calling the " + operation_name + " operation")
+        self.response = {"Error": {"Code": code}}
+
+
+# boto3.dynamodb.conditions.Key("fuel_type").eq(value)
+class Key:
+
+    def __init__(self, name):
+        self.name = name
+
+    def eq(self, value):
+        return (self.name, value)
+
+
+class LambdaClient:
+
+    def invoke(self, FunctionName, InvocationType='RequestResponse', Payload='{}'):
+        count("lambda", "invoke")
+        function_name = FunctionName.split(":")[-1]
+        if function_name not in functions:
+            raise ClientError("ResourceNotFoundException", "Invoke")
+        reply = functions[function_name](json.loads(Payload))
+        return {'StatusCode': 200, 'Payload': io.BytesIO(json.dumps(reply).encode("utf-8"))}
+
+
+class Table:
+
+    def __init__(self, name):
+        self.name = name
+
+    def get_table(self):
+        if self.name not in tables:
+            raise ClientError("ResourceNotFoundException", "GetItem")
+        return tables[self.name]
+
+    def get_item(self, Key, **kwargs):
+        count("dynamodb", "get_item")
+        table = self.get_table()
+        item = table["items"].get(Key[table["key"]])
+        return {'Item': item} if item is not None else {}
+
+    def query(self, KeyConditionExpression, **kwargs):
+        count("dynamodb", "query")
+        name, value = KeyConditionExpression
+        return {'Items': [item for item in self.get_table()["items"].values() if item.get(name) == value]}
+
+    def put_item(self, Item, **kwargs):
+        count("dynamodb", "put_item")
+        table = self.get_table()
+        table["items"][Item[table["key"]]] = Item
+        return {}
+
+    def scan(self, **kwargs):
+        count("dynamodb", "scan")
+        return {'Items': list(self.get_table()["items"].values())}
+
+
+class DynamoDBResource:
+
+    def Table(self, name):
+        return Table(name)
+
+    def batch_get_item(self, RequestItems):
+        count("dynamodb", "batch_get_item")
+        responses = {}
+        for table_name, request in RequestItems.items():
+            table = Table(table_name).get_table()
+            responses[table_name] = [table["items"][key[table["key"]]] for key in request['Keys']
+                                     if key[table["key"]] in table["items"]]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+
+class S3Object:
+
+    def __init__(self, key):
+        self.key = key
+
+    def etag(self):
+        return '"' + str(hash(objects[self.key])) + '"'
+
+    def get(self, **kwargs):
+        count("s3", "get")
+        if self.key not in objects:
+            raise ClientError("NoSuchKey", "GetObject")
+        return dict(object_details.get(self.key, {}), Body=io.BytesIO(objects[self.key]), ETag=self.etag())
+
+    def put(self, Body, IfNoneMatch=None, IfMatch=None, Metadata=None, ContentEncoding=None, **kwargs):
+        count("s3", "put")
+        if IfNoneMatch == "*" and self.key in objects:
+            raise ClientError("PreconditionFailed", "PutObject")
+        if IfMatch is not None and (self.key not in objects or self.etag() != IfMatch):
+            raise ClientError("PreconditionFailed", "PutObject")
+        objects[self.key] = Body.encode("utf-8") if isinstance(Body, str) else bytes(Body)
+        object_details[self.key] = {'Metadata': dict(Metadata or {}), 'ContentEncoding': ContentEncoding}
+        return {'ETag': self.etag()}
+
+    # Copies an object of the same bucket, only the metadata is replaced
+    def copy_from(self, CopySource, CopySourceIfMatch=None, Metadata=None, ContentEncoding=None, **kwargs):
+        count("s3", "copy")
+        source = CopySource["Key"]
+        if source not in objects:
+            raise ClientError("NoSuchKey", "CopyObject")
+        if CopySourceIfMatch is not None and S3Object(source).etag() != CopySourceIfMatch:
+            raise ClientError("PreconditionFailed", "CopyObject")
+        objects[self.key] = objects[source]
+        object_details[self.key] = {'Metadata': dict(Metadata or {}), 'ContentEncoding': ContentEncoding}
+        return {'CopyObjectResult': {'ETag': self.etag()}}
+
+    def delete(self, **kwargs):
+        count("s3", "delete")
+        objects.pop(self.key, None)
+        object_details.pop(self.key, None)
+        return {}
+
+
+# bucket.objects.filter(Prefix=..., Marker=...), the keys after the marker
+class S3ObjectCollection:
+
+    def filter(self, Prefix="", Marker="", **kwargs):
+        count("s3", "list")
+        return [S3Object(key) for key in sorted(objects) if key.startswith(Prefix) and key > Marker]
+
+
+class S3Bucket:
+
+    def __init__(self, name):
+        self.name = name
+        self.objects = S3ObjectCollection()
+
+    def Object(self, key):
+        return S3Object(key)
+
+
+class S3Resource:
+
+    def Bucket(self, name):
+        return S3Bucket(name)
+
+
+# botocore.config.Config, the settings have no effect on the fakes
+class Config:
+    def __init__(self, **settings):
+        self.settings = settings
+
+
+def resource(service_name, **kwargs):
+    return {"dynamodb": DynamoDBResource, "s3": S3Resource}[service_name]()
+
+
+def client(service_name, **kwargs):
+    return {"lambda": LambdaClient}[service_name]()
+
+
+# Puts the fake boto3 and botocore modules into sys.modules
+def install():
+    boto3 = types.ModuleType("boto3")
+    boto3.resource = resource
+    boto3.client = client
+    boto3_dynamodb = types.ModuleType("boto3.dynamodb")
+    conditions = types.ModuleType("boto3.dynamodb.conditions")
+    conditions.Key = Key
+    conditions.Attr = Key
+    botocore = types.ModuleType("botocore")
+    exceptions = types.ModuleType("botocore.exceptions")
+    exceptions.ClientError = ClientError
+    config = types.ModuleType("botocore.config")
+    config.Config = Config
+    sys.modules.update({
+        "boto3": boto3,
+        "boto3.dynamodb": boto3_dynamodb,
+        "boto3.dynamodb.conditions": conditions,
+        "botocore": botocore,
+        "botocore.exceptions": exceptions,
+        "botocore.config": config,
+    })
+    load_sample_data()
+
+
+def add_table(name, key, items):
+    tables[name] = {"key": key, "items": {item[key]: item for item in items}}
+
+
+# Plausible data for the tables and the remote functions
+def load_sample_data():
+    add_table("EmissionFactorsAfterDIN16258", "fuel_type", [
+        {"fuel_type": "Diesel", "THG_emissionfactor_TTW_kgCo2e/l": Decimal("2.65")},
+        {"fuel_type": "Petrol", "THG_emissionfactor_TTW_kgCo2e/l": Decimal("2.37")},
+        {"fuel_type": "LPG", "THG_emissionfactor_TTW_kgCo2e/l": Decimal("1.64")},
+        {"fuel_type": "Electricity", "THG_emissionfactor_TTW_kgCo2e/l": Decimal("0")},
+    ])
+    add_table("EmissionFactorsFuel_WTT", "fuel_type", [
+        {"fuel_type": "Diesel", "THG_emissionfactor_WTT_kgCo2e/l": Decimal("0.62")},
+        {"fuel_type": "Petrol", "THG_emissionfactor_WTT_kgCo2e/l": Decimal("0.58")},
+        {"fuel_type": "LPG", "THG_emissionfactor_WTT_kgCo2e/kg": Decimal("0.40")},
+        {"fuel_type": "Electricity"},
+    ])
+    add_table("AircraftCapacity", "Aircraft", [
+        {"Aircraft": "A380", "StandardSeating": Decimal(525)},
+        {"Aircraft": "A320", "StandardSeating": Decimal(150)},
+        {"Aircraft": "B737", "StandardSeating": Decimal(160)},
+    ])
+    add_table("RouteCache", "route", [])
+
+    functions["calculateDistanceBetweenAirports"] = lambda event: {
+        'statusCode': 200,
+        'body': {'distanceInKM': 100 + sum(map(ord, event["fromIATA"] + event["toIATA"])) % 900}
+    }
+    functions["getAirplaneEmissionsByAirplaneIdentifier"] = airplane_emissions
+    functions["getSpeedValuesBetweenTwoWaypoints"] = lambda event: {
+        'statusCode': 200,
+        'input': {'Origin': event["Origin"], 'Destination': event["Destination"], 'departure_country': "DE"},
+        'body': {'distance': 545000, 'distanceKmCity': 45, 'distanceKmHighway': 500}
+    }
+    functions["getCarFuelConsumptionAverage"] = lambda event: {
+        'statusCode': 200,
+        'body': {
+            'fuelInLPer100KmCity': 7.4, 'fuelInLPer100KmHighway': 5.3, 'fuelInLPer100KmComb': 6.1,
+            'electricityInKWHPer100KmCity': 15.2, 'electricityInKWHPer100KmHighway': 19.8, 'electricityInKWHPer100KmComb': 17.1
+        }
+    }
+    functions["calculateEmissionsForElectricityByCountry"] = lambda event: {
+        'statusCode': 200,
+        'body': {name: event["kWh"] * factor * (1 - event.get("green_electricity", 0)) for name, factor in [
+            ("directCO2min", 0.00031), ("directCO2med", 0.00038), ("directCO2max", 0.00045),
+            ("methaneCO2e", 0.000012), ("biogenicCO2e", 0.000021), ("waterConsumptionInL", 1.8)]}
+    }
+
+
+def airplane_emissions(event):
+    distance = float(event["distance"])
+    flight = {"Co2_kg": 9.5, "NOx_kg": 0.045, "SOx_kg": 0.003, "H2O_kg": 3.7, "CO_kg": 0.004, "HC_kg": 0.0005, "PM_Total_kg": 0.0002}
+    lto = {"Co2_kg": 2400.0, "NOx_kg": 11.0, "SOx_kg": 0.8, "H2O_kg": 940.0, "CO_kg": 7.0, "HC_kg": 0.8, "PM_Total_kg": 0.07}
+    return {
+        'statusCode': 200,
+        'body': {
+            'Flight_Emission': {name: value * distance for name, value in flight.items()},
+            'LTO_Emission': lto
+        }
+    }
@@ -0,0 +1,107 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from decimal import Decimal
+
+tools_directory = os.path.dirname(os.path.abspath(__file__))
+repository_directory = os.path.dirname(tools_directory)
+
+#-------------------------------------------------------------------------------
+# Local simulation of the event-driven invalidation of the emission factors,
+# with the stand-ins of fake_aws:
+#   1. a warm car container caches the factors of a fuel
+#   2. the factor is changed in EmissionFactorsAfterDIN16258
+#   3. a DynamoDB Streams record of the change is sent to FactorStream, which
+#      rewrites the fuel file and bumps the factor_version
+#   4. the warm container checks the version and calculates with the new factor
+# It fails (exit code 1) if the warm container does not see the new factor or
+# sees it before the stream record was processed.
+# Example: python Tools/simulate_factor_stream.py --fuel Diesel --factor 3.1
+#-------------------------------------------------------------------------------
+
+car_event = {"Origin": "Frankfurt", "Destination": "Berlin", "fuel consumption": "6.5"}
+table_name = "EmissionFactorsAfterDIN16258"
+ttw_attribute = "THG_emissionfactor_TTW_kgCo2e/l"
+
+
+# Builds the record which DynamoDB Streams sends for a changed item
+def stream_record(fuel, old_factor, new_factor):
+    return {
+        "eventName": "MODIFY",
+        "eventSource": "aws:dynamodb",
+        "eventSourceARN": "arn:aws:dynamodb:eu-central-1:000000000000:table/" + table_name + "/stream/2020-01-01T00:00:00.000",
+        "dynamodb": {
+            "Keys": {"fuel_type": {"S": fuel}},
+            "OldImage": {"fuel_type": {"S": fuel}, ttw_attribute: {"N": str(old_factor)}},
+            "NewImage": {"fuel_type": {"S": fuel}, ttw_attribute: {"N": str(new_factor)}},
+            "StreamViewType": "NEW_AND_OLD_IMAGES"
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulates a DynamoDB stream of the factor tables")
+    parser.add_argument("--fuel", default="Diesel")
+    parser.add_argument("--factor", type=float, default=3.1, help="new TTW factor in kgCO2e/l")
+    parser.add_argument("--check-interval", type=float, default=0.2,
+                        help="seconds between two version checks of the warm container")
+    arguments = parser.parse_args()
+
+    sys.path.insert(0, tools_directory)
+    import fake_aws
+    fake_aws.install()
+    for directory in ("Shared", "FactorStream", "Car"):
+        sys.path.insert(0, os.path.join(repository_directory, directory))
+    import instrumentation
+    instrumentation.sample_rate = 0
+    import factor_version
+    factor_version.check_interval_seconds = arguments.check_interval
+    import calculateCarbonEmissionBusForTravel as car
+    import refreshEmissionFactorsOnChange as factor_stream
+
+    event = dict(car_event, fuel=arguments.fuel)
+    item = fake_aws.tables[table_name]["items"][arguments.fuel]
+    old_factor = item[ttw_attribute]
+
+    def co2_equivalent():
+        with contextlib.redirect_stdout(io.StringIO()):
+            reply = car.lambda_handler(dict(event), None)
+        return reply["body"]["scope1"]["CO2_äquivalent"] if "scope1" in reply["body"] else reply["body"]["CO2_äquivalent"]
+
+    steps = []
+    before = co2_equivalent()
+    steps.append({"step": "warm container, old factor", "factor": float(old_factor), "CO2_äquivalent": before})
+
+    # A new item, the fake table hands out its items without a copy
+    fake_aws.tables[table_name]["items"][arguments.fuel] = dict(item, **{ttw_attribute: Decimal(str(arguments.factor))})
+    time.sleep(arguments.check_interval)
+    cached = co2_equivalent()
+    steps.append({"step": "table changed, no stream record yet", "CO2_äquivalent": cached})
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        stream_reply = factor_stream.lambda_handler({"Records": [stream_record(arguments.fuel, old_factor, arguments.factor)]}, None)
+    steps.append({"step": "stream record processed", "reply": stream_reply})
+
+    start = time.perf_counter()
+    after = co2_equivalent()
+    while after == before and time.perf_counter() - start < arguments.check_interval * 5:
+        time.sleep(arguments.check_interval / 4)
+        after = co2_equivalent()
+    steps.append({"step": "warm container after the version check", "factor": arguments.factor, "CO2_äquivalent": after,
+                  "seconds_after_stream": round(time.perf_counter() - start, 3)})
+
+    fuel_file = json.loads(fake_aws.objects[arguments.fuel + ".json"].decode("utf-8"))
+    steps.append({"step": "fuel file in the bucket", "fuel_values": fuel_file["fuel_values"]})
+    print(json.dumps(steps, indent=2, ensure_ascii=False, default=str))
+
+    if cached != before or after == before or stream_reply.get("statusCode") != 200:
+        print("The warm container did not follow the stream", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()